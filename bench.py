@@ -0,0 +1,342 @@
+"""
+Banco de pruebas de rendimiento con un sitio local que imita a DMAX.
+
+Levanta un servidor HTTP con las mismas estructuras de las que depende main.py (JSON-LD `ItemList`,
+enlaces `category-link__letter__list__item`, desplegable `select__value`/`select__option`, tarjetas
+`card--video` y un reproductor que pide un `.mpd`) y sirve contenido DASH sintético generado con ffmpeg.
+Mide las funciones clave de main.py y añade el resultado a un fichero JSON Lines para comparar versiones.
+
+Uso:
+    python bench.py                         # todos los casos disponibles, 5 repeticiones
+    python bench.py --latencia 80 --solo series_http,mpd_http
+    python bench.py --servir                # solo el sitio local (para main.py --base-url ...)
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+
+import main
+
+BENCH_RESULTS_PATH = os.path.join(main.OUTPUT_BASE_DIR, ".bench.jsonl")
+BENCH_ASSETS_DIR = os.path.join(main.OUTPUT_BASE_DIR, ".bench-dash") # DASH sintético; se genera una vez
+BENCH_DASH_SECONDS = 20 # Duración del vídeo sintético
+BENCH_REGRESSION_PCT = 10 # Mediana más lenta que la ejecución anterior en este % = regresión
+
+# --- Sitio local ---
+def series_slug(i): return f"serie-{i:04d}"
+def series_name(i): return f"Serie de prueba {i:04d}"
+def episode_title(season, ep): return f"{main.EPISODE_NUMBER_PREFIX}{ep} (T{season})"
+
+class FixtureSite:
+    def __init__(self, num_series=200, num_seasons=3, num_episodes=8, latency_ms=0, dash_dir=None):
+        self.num_series, self.num_seasons, self.num_episodes = num_series, num_seasons, num_episodes
+        self.latency_ms, self.dash_dir = latency_ms, dash_dir
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.server = None
+
+    @property
+    def base_url(self): return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def mpd_path(self, slug, season, ep): return f"/dash/{slug}/t{season}/e{ep}/manifest.mpd"
+    def episode_path(self, slug, season, ep): return f"/series/{slug}/temporada-{season}/episodio-{ep}"
+
+    def seasons_for(self, slug):
+        # La serie 0 tiene una sola temporada (sin desplegable), como las series cortas de DMAX.
+        return 1 if slug == series_slug(0) else self.num_seasons
+
+    def series_list_page(self):
+        items = [{"@type": "ListItem", "position": i + 1,
+                  "item": {"@type": "Webpage", "name": series_name(i), "url": f"{self.base_url}/series/{series_slug(i)}"}}
+                 for i in range(self.num_series)]
+        links = "".join(f'<li class="category-link__letter__list__item"><a class="link" href="/series/{series_slug(i)}">{series_name(i)}</a></li>'
+                        for i in range(self.num_series))
+        json_ld = json.dumps({"@context": "https://schema.org", "@type": "ItemList", "itemListElement": items})
+        return self.layout("Series", f'<script type="application/ld+json">{json_ld}</script><ul class="category-link__letter__list">{links}</ul>')
+
+    def card_html(self, slug, season, ep):
+        title = episode_title(season, ep)
+        return (f'<div class="card card--video" data-mpd="{self.mpd_path(slug, season, ep)}">'
+                f'<a href="{self.episode_path(slug, season, ep)}"><div class="card__placeholder"></div>'
+                f'<img src="/img/{slug}-{season}-{ep}.jpg" aria-label="{title}"></a><h2>{title}</h2></div>')
+
+    def series_page(self, slug):
+        seasons = self.seasons_for(slug)
+        cards = {s: "".join(self.card_html(slug, s, ep) for ep in range(1, self.num_episodes + 1)) for s in range(1, seasons + 1)}
+        episodes = [{"@type": "TVEpisode", "name": episode_title(s, ep), "url": f"{self.base_url}{self.episode_path(slug, s, ep)}"}
+                    for s in range(1, seasons + 1) for ep in range(1, self.num_episodes + 1)]
+        json_ld = json.dumps({"@context": "https://schema.org", "@type": "TVSeries", "name": slug, "episode": episodes})
+        if seasons > 1:
+            options = "".join(f'<div class="select__option" data-season="{s}">Temporada {s}</div>' for s in range(1, seasons + 1))
+            selector = (f'<div class="select"><div class="select__value" id="season-value">Temporada 1</div>'
+                        f'<div class="select__list" id="season-options" style="display:none">{options}</div></div>')
+        else: selector = '<div class="sonicshow__title">Temporada 1</div>'
+        body = (f'<script type="application/ld+json">{json_ld}</script>{selector}'
+                f'<div class="grid"><div class="grid__content" id="cards">{cards[1]}</div></div>'
+                f'<script>window.SEASON_CARDS = {json.dumps(cards)};</script>{PLAYER_JS}')
+        return self.layout(slug, body)
+
+    def episode_page(self, slug, season, ep):
+        return self.layout(episode_title(season, ep), f'<div class="player" data-video-id="{slug}-{season}-{ep}"></div>'
+                           f'<script>window.playerConfig = {{"src": "{self.base_url}{self.mpd_path(slug, season, ep)}"}};</script>')
+
+    def layout(self, title, body):
+        return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{title}</title>'
+                f'<link rel="stylesheet" href="/fonts/fuente.woff2"></head><body>{COOKIE_BANNER_HTML}{body}</body></html>')
+
+    def serve(self):
+        site = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            def log_message(self, *args): pass
+            def do_GET(self):
+                with site._lock: site.requests += 1
+                if site.latency_ms: time.sleep(site.latency_ms / 1000)
+                status, content_type, body = site.route(urlparse(self.path).path)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def route(self, path):
+        html_type = "text/html; charset=utf-8"
+        if path.rstrip("/") == "/series": return 200, html_type, self.series_list_page().encode()
+        match = re.fullmatch(r"/series/([\w-]+)/temporada-(\d+)/episodio-(\d+)", path)
+        if match: return 200, html_type, self.episode_page(match.group(1), int(match.group(2)), int(match.group(3))).encode()
+        match = re.fullmatch(r"/series/([\w-]+)/?", path)
+        if match: return 200, html_type, self.series_page(match.group(1)).encode()
+        match = re.fullmatch(r"/dash/[\w-]+/t\d+/e\d+/([\w.-]+)", path)
+        if match and self.dash_dir: # Todos los episodios comparten el mismo contenido sintético
+            asset = os.path.join(self.dash_dir, match.group(1))
+            if os.path.isfile(asset):
+                with open(asset, "rb") as f: data = f.read()
+                return 200, "application/dash+xml" if asset.endswith(".mpd") else "video/mp4", data
+        if path.endswith("/manifest.mpd"): return 200, "application/dash+xml", PLACEHOLDER_MPD.encode() # Sin ffmpeg: basta para capturarlo
+        if path.startswith(("/img/", "/fonts/")): return 200, "application/octet-stream", b"\0" * 2048
+        return 404, "text/plain", b"no encontrado"
+
+    def close(self):
+        if self.server: self.server.shutdown(); self.server.server_close()
+
+PLACEHOLDER_MPD = ('<?xml version="1.0"?><MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" mediaPresentationDuration="PT2S">'
+                   '<Period><AdaptationSet mimeType="video/mp4"><Representation id="v" bandwidth="1000" width="640" height="360">'
+                   '<SegmentTemplate initialization="init.m4s" media="seg-$Number$.m4s" duration="2" startNumber="1"/>'
+                   '</Representation></AdaptationSet></Period></MPD>')
+
+COOKIE_BANNER_HTML = ('<div id="onetrust-banner-sdk"><button id="onetrust-accept-btn-handler" '
+                      'onclick="document.getElementById(\'onetrust-banner-sdk\').style.display=\'none\'">ACEPTAR TODO</button></div>')
+
+# Desplegable de temporadas y reproductor: como en DMAX, las tarjetas se cambian con JavaScript tras un
+# pequeño retardo y el clic en una tarjeta hace que el reproductor pida el manifiesto.
+PLAYER_JS = """<script>
+(function () {
+  var value = document.getElementById('season-value'), options = document.getElementById('season-options');
+  if (value) {
+    value.addEventListener('click', function () { options.style.display = options.style.display === 'none' ? 'block' : 'none'; });
+    options.addEventListener('click', function (e) {
+      var option = e.target.closest('.select__option'); if (!option) return;
+      value.textContent = option.textContent; options.style.display = 'none';
+      document.getElementById('cards').innerHTML = '';
+      setTimeout(function () { document.getElementById('cards').innerHTML = window.SEASON_CARDS[option.dataset.season]; }, 150);
+    });
+  }
+  document.addEventListener('click', function (e) {
+    var card = e.target.closest('.card--video'); if (card) fetch(card.dataset.mpd).catch(function () {});
+  });
+})();
+</script>"""
+
+def generate_dash_assets(target_dir, seconds=BENCH_DASH_SECONDS):
+    # Vídeo + audio de prueba en DASH con plantilla de segmentos. Devuelve None si no hay ffmpeg.
+    if os.path.isfile(os.path.join(target_dir, "manifest.mpd")): return target_dir
+    if not shutil.which("ffmpeg"): return None
+    os.makedirs(target_dir, exist_ok=True)
+    for video_codec in (["-c:v", "libx264", "-preset", "ultrafast"], ["-c:v", "mpeg4"]):
+        command = ["ffmpeg", "-y", "-v", "error", "-f", "lavfi", "-i", f"testsrc=size=640x360:rate=25:duration={seconds}",
+                   "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}", *video_codec, "-c:a", "aac",
+                   "-f", "dash", "-seg_duration", "2", "-use_template", "1", "-use_timeline", "0",
+                   os.path.join(target_dir, "manifest.mpd")]
+        if subprocess.run(command, capture_output=True).returncode == 0: return target_dir
+    return None
+
+# --- Medición ---
+def summarize(durations):
+    return {"n": len(durations), "min": round(min(durations), 4), "median": round(main.percentile(durations, 50), 4),
+            "p95": round(main.percentile(durations, 95), 4), "mean": round(sum(durations) / len(durations), 4)}
+
+def measure(name, fn, repetitions, setup=None, check=bool):
+    # Ejecuta fn `repetitions` veces (setup fuera del tiempo medido); None si el caso no produce un resultado válido.
+    durations = []
+    for _ in range(repetitions):
+        if setup: setup()
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        if not check(result): print(f"  {name}: resultado inválido ({result!r}). Caso descartado."); return None
+        durations.append(elapsed)
+    stats = summarize(durations)
+    print(f"  {name:<24} mediana {stats['median']:>8.3f}s  p95 {stats['p95']:>8.3f}s  (n={stats['n']})")
+    return stats
+
+def remove_outputs(*paths):
+    for path in paths:
+        for candidate in (path, main.journal_path(path)):
+            if os.path.exists(candidate): os.remove(candidate)
+
+def run_cases(site, args, work_dir):
+    selected = set(args.solo.split(",")) if args.solo else None
+    wanted = lambda name: selected is None or name in selected
+    results, reps = {}, args.repeticiones
+    multi_slug, multi_url = series_slug(1), f"{site.base_url}/series/{series_slug(1)}"
+    last_season = f"Temporada {site.num_seasons}"
+    mpd_url = f"{site.base_url}{site.mpd_path(multi_slug, 1, 1)}"
+
+    print("\n--- Casos sin navegador ---")
+    if wanted("parse_series_page"):
+        page_html = main.fetch_page_text(f"{site.base_url}/series")
+        results["parse_series_page"] = measure("parse_series_page", lambda: main.extract_series_from_page(main.parse_dmax_page(page_html)), reps)
+    if wanted("series_http"):
+        results["series_http"] = measure("series_http", main.get_all_series_http, reps, setup=main._page_cache.clear)
+    if wanted("mpd_http"):
+        results["mpd_http"] = measure("mpd_http", lambda: main.resolve_mpd_via_http(multi_url, episode_title(1, 1)), reps,
+                                      setup=main._page_cache.clear)
+
+    if not args.sin_navegador and any(wanted(n) for n in ("driver_startup", "series_browser", "season_select", "mpd_click")):
+        print("\n--- Casos con navegador ---")
+        driver = None
+        try:
+            start = time.perf_counter()
+            driver = main.setup_driver_local(profile=args.perfil)
+            results["driver_startup"] = summarize([time.perf_counter() - start])
+            if wanted("series_browser"):
+                results["series_browser"] = measure("series_browser", lambda: main.get_all_series(driver), reps)
+            if wanted("season_select"):
+                results["season_select"] = measure("season_select", lambda: main.select_season_interactive(driver, multi_url, last_season),
+                                                   reps, setup=lambda: driver.get("about:blank"))
+            if wanted("mpd_click"):
+                fast_resolver, main.FAST_MPD_RESOLVER = main.FAST_MPD_RESOLVER, False # Se mide la captura en el navegador
+                state = {"i": 0, "cards": []}
+                def open_series():
+                    driver.get(multi_url); main.accept_cookies(driver)
+                    main.wait_for_count_stable(driver, "episode_cards", main.EPISODE_CARDS_XPATH) # Página multitemporada: no es "season_single"
+                    state["cards"] = main.get_episode_elements_for_current_season(driver)
+                def click():
+                    card = state["cards"][state["i"] % len(state["cards"])]; state["i"] += 1
+                    return main.click_episode_and_get_mpd(driver, card, episode_title(1, state["i"]))
+                try: results["mpd_click"] = measure("mpd_click", click, reps, setup=open_series)
+                finally: main.FAST_MPD_RESOLVER = fast_resolver
+        except Exception as e: print(f"  Navegador no disponible ({e}). Casos con navegador omitidos.")
+        finally:
+            if driver:
+                try: driver.quit()
+                except Exception: pass
+
+    print("\n--- Descargas ---")
+    if not site.dash_dir: print("  Sin ffmpeg: no hay contenido DASH sintético. Descargas omitidas.")
+    else:
+        native_out, ytdlp_out = os.path.join(work_dir, "nativo.mp4"), os.path.join(work_dir, "ytdlp.mp4")
+        if wanted("download_native"):
+            results["download_native"] = measure("download_native", lambda: main.download_dash_native(mpd_url, native_out, multi_url),
+                                                 reps, setup=lambda: remove_outputs(native_out))
+        if wanted("download_ytdlp"):
+            if not shutil.which("yt-dlp"): print("  yt-dlp no está en el PATH. Caso download_ytdlp omitido.")
+            else: results["download_ytdlp"] = measure("download_ytdlp", lambda: main.download_video_with_yt_dlp(mpd_url, ytdlp_out, multi_url),
+                                                      reps, setup=lambda: remove_outputs(ytdlp_out))
+    return {name: stats for name, stats in results.items() if stats}
+
+# --- Resultados comparables ---
+def git_revision():
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo_dir, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--", "main.py", "bench.py"], cwd=repo_dir, capture_output=True, text=True).stdout.strip()
+        return commit + ("-modificado" if dirty else "")
+    except (OSError, subprocess.CalledProcessError): return None
+
+def load_previous_run(path, config):
+    # Última ejecución con la misma configuración (mismo sitio, latencia y perfil): solo esas son comparables.
+    previous = None
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try: record = json.loads(line)
+                except ValueError: continue
+                if record.get("config") == config: previous = record
+    except FileNotFoundError: pass
+    return previous
+
+def print_comparison(results, previous, threshold_pct):
+    if not previous: print("\nSin ejecución anterior comparable."); return
+    print(f"\n--- Comparación con {previous.get('revision') or '?'} ({previous.get('label') or previous['timestamp']}) ---")
+    for name, stats in sorted(results.items()):
+        before = previous["results"].get(name)
+        if not before: print(f"  {name:<24} {stats['median']:>8.3f}s  (nuevo)"); continue
+        delta_pct = (stats["median"] - before["median"]) / before["median"] * 100 if before["median"] else 0.0
+        status = "REGRESIÓN" if delta_pct > threshold_pct else ("mejora" if delta_pct < -threshold_pct else "=")
+        print(f"  {name:<24} {before['median']:>8.3f}s -> {stats['median']:>8.3f}s  {delta_pct:>+7.1f}%  {status}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Mide main.py contra un sitio local que imita a DMAX.")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--latencia", type=int, default=0, metavar="MS", help="Latencia añadida a cada respuesta del sitio local.")
+    parser.add_argument("--series", type=int, default=200, help="Series en el listado.")
+    parser.add_argument("--temporadas", type=int, default=3)
+    parser.add_argument("--episodios", type=int, default=8, help="Episodios por temporada.")
+    parser.add_argument("--perfil", choices=["captura", "completo"], default=main.BROWSER_PROFILE)
+    parser.add_argument("--solo", metavar="CASO,...", help="Solo estos casos (p.ej. series_http,mpd_click).")
+    parser.add_argument("--sin-navegador", action="store_true", help="Omite los casos que necesitan Chrome.")
+    parser.add_argument("--salida", default=BENCH_RESULTS_PATH, help="Fichero JSON Lines donde se añade el resultado.")
+    parser.add_argument("--etiqueta", help="Texto libre para identificar la ejecución.")
+    parser.add_argument("--umbral", type=float, default=BENCH_REGRESSION_PCT, metavar="PCT")
+    parser.add_argument("--servir", action="store_true", help="Solo levanta el sitio local hasta Ctrl-C.")
+    return parser.parse_args()
+
+def main_bench():
+    args = parse_args()
+    site = FixtureSite(args.series, args.temporadas, args.episodios, args.latencia, generate_dash_assets(BENCH_ASSETS_DIR)).serve()
+    if args.servir:
+        print(f"Sitio local en {site.base_url} (python main.py --base-url {site.base_url}; usa su propio catálogo "
+              f"en {main.OUTPUT_BASE_DIR}/.sitios/). Ctrl-C para terminar.")
+        try:
+            while True: time.sleep(3600)
+        except KeyboardInterrupt: site.close(); return
+    work_dir = tempfile.mkdtemp(prefix="dmax-bench-")
+    # Estado aislado: ni el catálogo, ni las métricas, ni los perfiles del usuario influyen en la medida.
+    main.DMAX_BASE_URL = site.base_url
+    main.CATALOG_DB_PATH = os.path.join(work_dir, "catalogo.sqlite3")
+    main.BROWSER_PROFILES_DIR = os.path.join(work_dir, "perfiles")
+    main.METRICS_JSONL_PATH = ""
+    print(f"Sitio local en {site.base_url}; {args.repeticiones} repeticiones, latencia {args.latencia} ms.")
+    try: results = run_cases(site, args, work_dir)
+    finally:
+        site.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    config = {"series": args.series, "seasons": args.temporadas, "episodes": args.episodios, "latency_ms": args.latencia,
+              "profile": args.perfil, "repetitions": args.repeticiones}
+    previous = load_previous_run(args.salida, config)
+    record = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "revision": git_revision(), "label": args.etiqueta,
+              "python": platform.python_version(), "platform": platform.platform(), "config": config,
+              "site_requests": site.requests, "results": results}
+    os.makedirs(os.path.dirname(args.salida) or ".", exist_ok=True)
+    with open(args.salida, "a", encoding="utf-8") as f: f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print_comparison(results, previous, args.umbral)
+    print(f"\nResultado añadido a {args.salida}")
+    return 0 if results else 1
+
+if __name__ == "__main__":
+    sys.exit(main_bench())
@@ -1,8 +1,36 @@
 import time
+import asyncio
+import contextvars
 import subprocess
 import json
 import os
 import re
+import threading
+import queue
+import html
+import sqlite3
+import argparse
+import hashlib
+import functools
+import math
+import shutil
+import collections
+import random
+import xml.etree.ElementTree as ET
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlparse
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+try:
+    import yaml # Opcional: solo para ficheros de trabajos en YAML
+except ImportError:
+    yaml = None
+try:
+    import httpx # Opcional: cliente HTTP/2 (usa h2) para los segmentos DASH
+except ImportError:
+    httpx = None
+import requests
+from requests.adapters import HTTPAdapter
 from seleniumwire import webdriver
 from selenium.webdriver.chrome.service import Service as ChromeService
 from webdriver_manager.chrome import ChromeDriverManager
@@ -10,15 +38,96 @@ from selenium.webdriver.chrome.options import Options as ChromeOptions
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, ElementClickInterceptedException
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, ElementClickInterceptedException, WebDriverException
 
 # --- Configuraciones Técnicas (pueden quedarse como globales o moverse a un config si crece) ---
+DMAX_BASE_URL = "https://dmax.marca.com" # Cambiar para apuntar a un servidor local de pruebas
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 MPD_URL_IDENTIFIER = ".mpd"
 WAIT_FOR_MPD_TIMEOUT = 45
 SELENIUM_TIMEOUT = 30 # Un poco más de margen para interacciones
-MAX_RETRIES_MPD = 1
+MAX_RETRIES_MPD = 3 # Reintentos (con espera exponencial) al capturar el MPD en el navegador
 EPISODE_NUMBER_PREFIX = "Episodio " # Ajusta si los títulos son solo números
 OUTPUT_BASE_DIR = "DMAX_Descargas"
+DOWNLOAD_BACKEND = "nativo" # "nativo" (motor DASH en proceso, con yt-dlp de respaldo) o "yt-dlp"
+DASH_SEGMENT_WORKERS = 8 # Segmentos descargados a la vez por episodio
+DASH_SEGMENT_RETRIES = 4 # Intentos por segmento
+YTDLP_ATTEMPTS = 2 # Intentos por descarga con yt-dlp (solo ante errores transitorios)
+# Planificador compartido: token bucket por host con ajuste AIMD y reintentos con backoff exponencial
+RATE_INITIAL_PER_HOST = 10.0 # Peticiones/segundo iniciales por host
+RATE_MIN_PER_HOST = 0.5
+RATE_MAX_PER_HOST = 100.0
+RATE_INCREASE_STEP = 0.5 # Subida aditiva por cada respuesta sana
+RATE_DECREASE_FACTOR = 0.5 # Bajada multiplicativa ante 429/503
+RETRY_BASE_DELAY = 1.0 # Segundos; se duplica en cada intento
+RETRY_MAX_DELAY = 60.0
+DASH_MAX_HEIGHT = None # Limitar la resolución de vídeo (p.ej. 720); None = la mejor
+DASH_AUDIO_LANGS = ("es", "spa", "es-ES") # Idiomas de audio preferidos, en orden
+DASH_CHECKPOINT_SECONDS = 2 # Cada cuánto se guarda el diario de progreso de una descarga
+HAS_CLASS_XPATH = "contains(concat(' ', normalize-space(@class), ' '), ' {} ')" # Clase completa: 'select__options' no es 'select__option'
+SEASON_TRIGGER_XPATH = f"//div[{HAS_CLASS_XPATH.format('select__value')} and contains(., 'Temporada')]"
+SEASON_OPTIONS_XPATH = f"//div[{HAS_CLASS_XPATH.format('select__option')}]"
+SINGLE_SEASON_TITLE_XPATH = f"//div[{HAS_CLASS_XPATH.format('sonicshow__title')} and contains(text(), 'Temporada')]"
+EPISODE_CARDS_XPATH = f"//div[{HAS_CLASS_XPATH.format('card--video')}][.//img[@aria-label]]"
+COOKIE_BUTTON_XPATH = "//button[contains(text(), 'ACEPTAR TODO') or contains(text(), 'Aceptar y cerrar') or @id='onetrust-accept-btn-handler']"
+MAX_PARALLEL_DOWNLOADS = 3 # Descargas simultáneas (etapa de descarga del orquestador)
+RESOLVE_CONCURRENCY = 6 # Resoluciones de MPD sin navegador (catálogo/checkpoint/HTTP) a la vez
+DOWNLOAD_QUEUE_SIZE = 6 # Máximo de MPDs pendientes antes de frenar la búsqueda en el navegador
+FAST_MPD_RESOLVER = True # Intentar obtener el MPD por HTTP antes de hacer clic con Selenium
+HTTP_TIMEOUT = 10
+HTTP_PAGE_CACHE_SECONDS = 60 # Reutilizar el HTML de una página durante la resolución de una temporada
+# Endpoint JSON de reproducción, si se conoce. Recibe {video_id}; None para usar solo el HTML/JSON-LD.
+PLAYBACK_API_URL_TEMPLATE = None
+CATALOG_DB_PATH = os.path.join(OUTPUT_BASE_DIR, ".catalogo.sqlite3")
+CATALOG_TTL = { # Segundos de validez de cada tipo de entrada del catálogo
+    "series": 7 * 24 * 3600,
+    "seasons": 24 * 3600,
+    "episodes": 12 * 3600,
+    "mpd": 6 * 3600, # Las URLs de los manifiestos suelen llevar tokens que caducan
+}
+CATALOG_STALE_GRACE = 7 * 24 * 3600 # Tiempo que se conserva una entrada caducada para --refresh
+CATALOG_MAX_ENTRIES = 20000 # Por encima se eliminan las entradas menos usadas
+MIRROR_PRIORITY_RULES = [] # Modo espejo (--prioridad): "recientes", "pequenas" y/o "serie:<slug>", en orden
+MIRROR_BATCH_SIZE = 20 # Episodios de una misma temporada que se sacan de la cola de una vez
+MIRROR_MAX_ATTEMPTS = 3 # Intentos por episodio antes de marcarlo como fallido
+MIRROR_QUOTA_BYTES = None # Tamaño máximo de OUTPUT_BASE_DIR (--cuota-gb); None = sin límite
+MIRROR_MIN_FREE_BYTES = 5 * 1024 ** 3 # Espacio libre mínimo en disco (--min-libre-gb)
+MIRROR_ESTIMATED_EPISODE_BYTES = 1024 ** 3 # Espacio reservado por episodio encolado mientras no haya episodios descargados
+SERIES_STATE_FILENAME = ".estado.json" # Estado de descargas por serie, dentro de OUTPUT_BASE_DIR/<serie>/
+VERIFY_DURATION_TOLERANCE = 2.0 # Segundos de diferencia admitidos entre ffprobe y la duración del MPD...
+VERIFY_DURATION_TOLERANCE_PCT = 1.0 # ...o este % de la duración, lo que sea mayor
+BROWSER_POOL_SIZE = 1 # Navegadores en paralelo en los modos por lotes y espejo (--navegadores)
+BROWSER_POOL_BASE_PORT = 12000 # Puerto del proxy de selenium-wire del navegador 0; los demás, consecutivos
+BROWSER_PROFILES_DIR = os.path.join(OUTPUT_BASE_DIR, ".perfiles")
+BROWSER_TASK_RETRIES = 2 # Reintentos de una tarea cuyo navegador se ha caído
+# Perfil "captura": headless, sin imágenes/fuentes/vídeo/publicidad, perfil persistente (cookies y caché entre
+# ejecuciones). "completo": Chrome visible que lo carga todo, como antes (útil para depurar XPaths). (--perfil)
+BROWSER_PROFILE = "captura"
+CAPTURE_WINDOW_SIZE = "1280,720"
+CAPTURE_BLOCK_PATTERNS = [ # Regex sobre la URL; el manifiesto nunca se bloquea
+    r"\.(?:png|jpe?g|gif|webp|avif|svg|ico|bmp)(?:\?|$)", # Imágenes
+    r"\.(?:woff2?|ttf|otf|eot)(?:\?|$)", # Fuentes
+    r"\.(?:m4s|m4v|m4a|mp4|webm|mp3|aac|ts|vtt)(?:\?|$)", # Segmentos de vídeo/audio: basta con la petición del MPD
+    r"^https?://[^/]*(?:doubleclick\.net|googlesyndication\.com|googleadservices\.com|googletagservices\.com|"
+    r"google-analytics\.com|googletagmanager\.com|adnxs\.com|amazon-adsystem\.com|criteo\.(?:com|net)|"
+    r"scorecardresearch\.com|chartbeat\.(?:com|net)|facebook\.net|hotjar\.com|taboola\.com|outbrain\.com|"
+    r"smartadserver\.com|rubiconproject\.com|pubmatic\.com|teads\.tv|imasdk\.googleapis\.com)(?::\d+)?/",
+]
+CHROMEDRIVER_PATH = os.environ.get("CHROMEDRIVER_PATH") # Fijo; si no, la ruta que webdriver-manager resolvió la última vez (el PATH solo sin red)
+CHROMEDRIVER_PIN_FILE = os.path.join(BROWSER_PROFILES_DIR, "chromedriver.txt")
+# Esperas por condición (sustituyen a las pausas fijas)
+WAIT_POLL_INTERVAL = 0.1
+READY_WAIT_TIMEOUT = 15 # Límite de cada espera por condición
+DOM_QUIET_MS = 500 # Sin mutaciones del DOM durante este tiempo = página asentada
+NETWORK_IDLE_MS = 500 # Sin recursos nuevos durante este tiempo = red inactiva
+COUNT_STABLE_SECONDS = 0.75 # Número de tarjetas/opciones sin cambios durante este tiempo
+COOKIE_BANNER_GRACE_MS = 1500 # Si la página lleva este tiempo quieta sin banner, se da por aceptado
+METRICS_JSONL_PATH = os.path.join(OUTPUT_BASE_DIR, ".metricas.jsonl") # Un span JSON por línea (--metricas)
+METRICS_PROMETHEUS_PATH = None # Fichero de texto Prometheus (--prometheus), p.ej. para el textfile collector
+LATENCY_BUDGETS = { # Segundos máximos esperados por espera en cada fase (--presupuesto fase=seg)
+    "cookies": 4, "series_list": 5, "season_options": 3, "season_switch": 8,
+    "season_single": 3, "episode_click": 3, "mpd_capture": 15, "episode_gap": 3,
+}
 
 # --- Funciones de Utilidad ---
 def sanitize_filename(name):
@@ -29,35 +138,237 @@ def sanitize_filename(name):
     return name[:150]
 
 def build_series_url_from_slug(slug):
-    return f"https://dmax.marca.com/series/{slug}"
+    return f"{DMAX_BASE_URL}/series/{slug}"
+
+# --- Métricas: spans de tiempo por fase ---
+# Cada span es un dict {phase, series, season, episode, duration, ok, bytes, retries, ...} que se
+# escribe como una línea JSON en METRICS_JSONL_PATH y se resume al final (p50/p95 por fase).
+RUN_ID = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+_metrics_lock = threading.Lock()
+_metrics_spans = []
+_metrics_context = contextvars.ContextVar("metrics_context", default={}) # Por hilo y por tarea asyncio
+
+@contextlib.contextmanager
+def metrics_context(**fields):
+    # Campos (serie, temporada, episodio...) que heredan los spans abiertos en este hilo o tarea.
+    token = _metrics_context.set({**_metrics_context.get(), **{k: v for k, v in fields.items() if v is not None}})
+    try: yield
+    finally: _metrics_context.reset(token)
+
+@contextlib.contextmanager
+def span(phase, **fields):
+    record = {"run": RUN_ID, "phase": phase, **_metrics_context.get(), **fields}
+    start_wall, start = time.time(), time.monotonic()
+    try:
+        yield record
+    except BaseException as e:
+        record["ok"] = False
+        record.setdefault("error", type(e).__name__)
+        raise
+    finally:
+        record["start"] = round(start_wall, 3)
+        record["duration"] = round(time.monotonic() - start, 4)
+        record.setdefault("ok", True)
+        emit_span(record)
+
+def timed_phase(phase, fields=None, result_fields=None):
+    # Decorador: envuelve la función en un span. `fields(*args, **kwargs)` y
+    # `result_fields(result, *args, **kwargs)` añaden campos antes y después de la llamada.
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(phase, **(fields(*args, **kwargs) if fields else {})) as record:
+                result = fn(*args, **kwargs)
+                record.setdefault("ok", bool(result))
+                if result_fields: record.update(result_fields(result, *args, **kwargs))
+                return result
+        return wrapper
+    return decorator
+
+def emit_span(record):
+    with _metrics_lock:
+        _metrics_spans.append(record)
+        if not METRICS_JSONL_PATH: return
+        try:
+            os.makedirs(os.path.dirname(METRICS_JSONL_PATH) or ".", exist_ok=True)
+            with open(METRICS_JSONL_PATH, "a", encoding="utf-8") as f: f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e: print(f"No se pudo escribir la métrica: {e}")
+
+def percentile(values, pct):
+    # Percentil por rango más cercano (suficiente para tablas de resumen).
+    ordered = sorted(values)
+    if not ordered: return 0.0
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))]
+
+def summarize_spans():
+    with _metrics_lock: spans = list(_metrics_spans)
+    summary = {}
+    for record in spans:
+        phase = summary.setdefault(record["phase"], {"durations": [], "errors": 0, "bytes": 0, "retries": 0})
+        phase["durations"].append(record["duration"])
+        phase["errors"] += 0 if record.get("ok") else 1
+        phase["bytes"] += record.get("bytes", 0) or 0
+        phase["retries"] += record.get("retries", 0) or 0
+    return summary
+
+def print_metrics_summary():
+    summary = summarize_spans()
+    if not summary: return
+    print("\n--- Tiempos por fase ---")
+    print(f"  {'fase':<16}{'n':>5}{'errores':>9}{'p50':>9}{'p95':>9}{'total':>10}{'reint.':>8}{'MB':>10}")
+    for phase, data in sorted(summary.items(), key=lambda item: -sum(item[1]["durations"])):
+        durations = data["durations"]
+        print(f"  {phase:<16}{len(durations):>5}{data['errors']:>9}{percentile(durations, 50):>8.2f}s{percentile(durations, 95):>8.2f}s"
+              f"{sum(durations):>9.1f}s{data['retries']:>8}{data['bytes'] / 1e6:>10.1f}")
+
+def write_prometheus_metrics(path):
+    lines = [
+        "# HELP dmax_phase_duration_seconds Duración de cada fase de la descarga.",
+        "# TYPE dmax_phase_duration_seconds summary",
+    ]
+    summary = summarize_spans()
+    for phase, data in sorted(summary.items()):
+        durations = data["durations"]
+        for q in (0.5, 0.95):
+            lines.append(f'dmax_phase_duration_seconds{{phase="{phase}",quantile="{q}"}} {percentile(durations, q * 100):.4f}')
+        lines.append(f'dmax_phase_duration_seconds_sum{{phase="{phase}"}} {sum(durations):.4f}')
+        lines.append(f'dmax_phase_duration_seconds_count{{phase="{phase}"}} {len(durations)}')
+    for name, key, help_text in (("dmax_phase_errors_total", "errors", "Spans terminados con error."),
+                                 ("dmax_phase_retries_total", "retries", "Reintentos por fase."),
+                                 ("dmax_downloaded_bytes_total", "bytes", "Bytes descargados por fase.")):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        lines += [f'{name}{{phase="{phase}"}} {data[key]}' for phase, data in sorted(summary.items())]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f: f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path) # El collector nunca ve un fichero a medias
+
+# --- Captura de MPD por eventos ---
+class MpdCapture:
+    """
+    Interceptor de respuestas de selenium-wire. Se ejecuta en el hilo del proxy y despierta
+    al hilo que espera en cuanto llega la primera respuesta 2xx de un manifiesto.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self.mpd_url = None
+
+    def reset(self):
+        with self._lock:
+            self.mpd_url = None
+            self._event.clear()
+
+    def response_interceptor(self, request, response):
+        if MPD_URL_IDENTIFIER not in request.url: return
+        # Con perfil persistente, un manifiesto servido desde la caché de Chrome no pasaría por el proxy.
+        del response.headers['Cache-Control']
+        response.headers['Cache-Control'] = 'no-store'
+        if 200 <= response.status_code < 300:
+            with self._lock:
+                if self.mpd_url is None:
+                    self.mpd_url = request.url
+                    self._event.set()
+
+    def wait(self, timeout):
+        return self.mpd_url if self._event.wait(timeout) else None
+
+CAPTURE_BLOCK_REGEX = re.compile("|".join(CAPTURE_BLOCK_PATTERNS), re.IGNORECASE)
+
+def block_heavy_requests(request):
+    # request_interceptor del perfil "captura": corta en el proxy lo que no hace falta para que el reproductor pida el MPD.
+    if MPD_URL_IDENTIFIER not in request.url and CAPTURE_BLOCK_REGEX.search(request.url): request.abort()
+
+def install_mpd_capture(driver, block_resources=False):
+    # Con scopes, selenium-wire deja pasar sin registrar (ni guardar cuerpos) todo lo que no sea un manifiesto.
+    # Lo que se quiere bloquear también tiene que estar en scopes para que llegue al request_interceptor.
+    driver.scopes = [f".*{re.escape(MPD_URL_IDENTIFIER)}.*"] + (CAPTURE_BLOCK_PATTERNS if block_resources else [])
+    capture = MpdCapture()
+    driver.response_interceptor = capture.response_interceptor
+    if block_resources: driver.request_interceptor = block_heavy_requests
+    driver.mpd_capture = capture
+    return capture
+
+def install_chromedriver():
+    # Descarga (o reutiliza) el chromedriver que casa con el Chrome instalado y fija su ruta.
+    path = ChromeDriverManager().install()
+    os.makedirs(os.path.dirname(CHROMEDRIVER_PIN_FILE), exist_ok=True)
+    with open(CHROMEDRIVER_PIN_FILE, "w", encoding="utf-8") as f: f.write(path)
+    return path
+
+@functools.lru_cache(maxsize=None)
+def get_chromedriver_path():
+    # webdriver-manager consulta la red en cada install(); se resuelve una vez y se guarda la ruta.
+    if CHROMEDRIVER_PATH: return CHROMEDRIVER_PATH
+    try:
+        with open(CHROMEDRIVER_PIN_FILE, encoding="utf-8") as f: pinned = f.read().strip()
+        if pinned and os.path.isfile(pinned): return pinned
+    except FileNotFoundError: pass
+    try: return install_chromedriver()
+    except Exception as e: # Sin red: el chromedriver del PATH, aunque puede no casar con la versión de Chrome
+        on_path = shutil.which("chromedriver")
+        if on_path is None: raise
+        print(f"webdriver-manager no disponible ({e}). Se usa {on_path}.")
+        return on_path
+
+def forget_chromedriver_pin():
+    # El chromedriver fijado ya no arranca (p.ej. Chrome se ha actualizado): la próxima vez se vuelve a resolver.
+    get_chromedriver_path.cache_clear()
+    with contextlib.suppress(FileNotFoundError): os.remove(CHROMEDRIVER_PIN_FILE)
 
 # --- Configuración del Driver ---
-def setup_driver_local():
-    print("Configurando el driver LOCAL de Chrome con selenium-wire...")
+@timed_phase("driver_startup")
+def setup_driver_local(proxy_port=None, profile_dir=None, headless=None, profile=None):
+    profile = profile or BROWSER_PROFILE
+    capture = profile == "captura"
+    if headless is None: headless = capture
+    if profile_dir is None and capture: profile_dir = os.path.join(BROWSER_PROFILES_DIR, "captura")
+    print(f"Configurando el driver LOCAL de Chrome con selenium-wire (perfil {profile})...")
     chrome_options_local = ChromeOptions()
-    # Descomenta para headless:
-    # chrome_options_local.add_argument("--headless=new")
+    if headless: chrome_options_local.add_argument("--headless=new")
+    if profile_dir: # Perfil propio y persistente: cookies/caché entre ejecuciones, y varios Chrome a la vez
+        os.makedirs(profile_dir, exist_ok=True)
+        chrome_options_local.add_argument(f"--user-data-dir={os.path.abspath(profile_dir)}")
     # Optimizaciones comunes para headless/servidores:
     chrome_options_local.add_argument("--disable-gpu")
     chrome_options_local.add_argument("--no-sandbox") # Necesario en Linux/WSL/Docker
     chrome_options_local.add_argument("--disable-dev-shm-usage") # Crítico en Linux/WSL/Docker
-    chrome_options_local.add_argument("--window-size=1920,1080") # Tamaño de ventana para headless
-    # chrome_options_local.add_argument("--start-maximized") # Para no-headless
+    if capture:
+        chrome_options_local.add_argument(f"--window-size={CAPTURE_WINDOW_SIZE}")
+        for flag in ("--mute-audio", "--no-first-run", "--disable-extensions", "--disable-background-networking",
+                     "--disable-component-update", "--disable-sync", "--autoplay-policy=no-user-gesture-required"):
+            chrome_options_local.add_argument(flag)
+        # Imágenes desactivadas en el propio Chrome: ni siquiera llegan al proxy
+        chrome_options_local.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+    else:
+        chrome_options_local.add_argument("--window-size=1920,1080")
+        # chrome_options_local.add_argument("--start-maximized") # Para no-headless
     
-    ua = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    chrome_options_local.add_argument(f"user-agent={ua}")
+    chrome_options_local.add_argument(f"user-agent={USER_AGENT}")
     
     sw_options = {
         'auto_config': True, 
-        'disable_capture': False # Asegurar que la captura de red esté habilitada
+        'disable_capture': False, # Asegurar que la captura de red esté habilitada
+        'request_storage': 'memory',
+        'request_storage_max_size': 20 # Solo se guardan peticiones de manifiestos (ver scopes)
     }
-    try:
-        driver = webdriver.Chrome(
-            service=ChromeService(ChromeDriverManager().install()),
+    if proxy_port: sw_options['port'] = proxy_port
+    def start(chromedriver_path):
+        return webdriver.Chrome(
+            service=ChromeService(chromedriver_path),
             options=chrome_options_local,
             seleniumwire_options=sw_options
         )
+    try:
+        chromedriver_path = get_chromedriver_path()
+        try: driver = start(chromedriver_path)
+        except WebDriverException as e:
+            if CHROMEDRIVER_PATH: raise # Ruta elegida por el usuario: no se sustituye
+            print(f"El chromedriver {chromedriver_path} no arranca ({e.msg or e}). Se vuelve a instalar con webdriver-manager...")
+            forget_chromedriver_pin()
+            driver = start(install_chromedriver())
         driver.implicitly_wait(5) # Espera implícita general
+        install_mpd_capture(driver, block_resources=capture)
         print("Driver LOCAL de Chrome con selenium-wire configurado.")
         return driver
     except Exception as e:
@@ -66,18 +377,587 @@ def setup_driver_local():
             print("Asegúrate de que Google Chrome (o Chromium) está instalado y en el PATH.")
         raise
 
+def make_driver_factory(worker_id, headless=True):
+    # Cada navegador del pool tiene su propio puerto de proxy y su propio directorio de perfil.
+    def factory():
+        return setup_driver_local(proxy_port=BROWSER_POOL_BASE_PORT + worker_id,
+                                  profile_dir=os.path.join(BROWSER_PROFILES_DIR, f"navegador-{worker_id}"),
+                                  headless=headless)
+    return factory
+
+def is_driver_alive(driver):
+    try: driver.current_url; return True
+    except WebDriverException: return False
+
+class BrowserPool:
+    """
+    K navegadores, cada uno en su propio hilo y creado una sola vez con `make_driver_factory`.
+    Las tareas se reparten desde una cola común; un handler puede encolar tareas nuevas con
+    `submit`. Si un navegador se cae, se cierra, se crea otro y la tarea se reintenta.
+    """
+    def __init__(self, size=BROWSER_POOL_SIZE, factory_builder=make_driver_factory):
+        self.size = max(1, size)
+        self.factory_builder = factory_builder
+        self.tasks = queue.Queue()
+
+    def submit(self, task, attempt=0):
+        self.tasks.put((task, attempt))
+
+    def run(self, initial_tasks, handle_task):
+        for task in initial_tasks: self.submit(task)
+        threads = [threading.Thread(target=self._worker, args=(i, handle_task), name=f"navegador-{i}", daemon=True)
+                   for i in range(self.size)]
+        for t in threads: t.start()
+        self.tasks.join() # Incluye las tareas que los handlers van añadiendo
+        for _ in threads: self.tasks.put(None)
+        for t in threads: t.join()
+
+    def _worker(self, worker_id, handle_task):
+        factory = self.factory_builder(worker_id)
+        driver = None
+        def get_driver():
+            nonlocal driver
+            if driver is None: driver = factory()
+            return driver
+        try:
+            while True:
+                item = self.tasks.get()
+                if item is None: self.tasks.task_done(); return
+                task, attempt = item
+                if DOWNLOAD_SHUTDOWN.is_set(): self.tasks.task_done(); continue # Ctrl-C: se vacía la cola sin ejecutar nada
+                try:
+                    handle_task(task, get_driver, self.submit)
+                    crashed = driver is not None and not is_driver_alive(driver)
+                except WebDriverException as e:
+                    print(f"[navegador-{worker_id}] Error de WebDriver: {e}"); crashed = True
+                except Exception as e:
+                    print(f"[navegador-{worker_id}] Error en tarea {task}: {e}")
+                    crashed = driver is None or not is_driver_alive(driver)
+                if crashed:
+                    print(f"[navegador-{worker_id}] Navegador caído. Reciclando...")
+                    try:
+                        if driver: driver.quit()
+                    except Exception: pass
+                    driver = None
+                    if DOWNLOAD_SHUTDOWN.is_set(): pass # Ni se reintenta ni se arranca otro Chrome
+                    elif attempt < BROWSER_TASK_RETRIES: self.submit(task, attempt + 1)
+                    else: print(f"[navegador-{worker_id}] Tarea abandonada tras {attempt + 1} intentos: {task}")
+                self.tasks.task_done()
+        finally:
+            if driver:
+                try: driver.quit()
+                except Exception: pass
+
+# --- Planificador: ritmo por host y reintentos ---
+class TransientError(Exception):
+    # Fallo que merece reintento (p.ej. el reproductor no pidió el MPD esta vez).
+    pass
+
+HTTP_ERRORS = (requests.RequestException,) + ((httpx.HTTPError,) if httpx is not None else ())
+RETRYABLE_ERRORS = HTTP_ERRORS + (TransientError, ConnectionError, TimeoutError)
+
+def error_status(error):
+    status = getattr(error, "status", None)
+    response = getattr(error, "response", None)
+    if status is None and response is not None: status = getattr(response, "status_code", None)
+    return status
+
+def classify_error(error):
+    # "throttled" (bajar el ritmo y reintentar), "transient" (reintentar) o "permanent" (abandonar).
+    status = error_status(error)
+    if status is not None:
+        if status in (429, 503): return "throttled"
+        if status >= 500 or status == 408: return "transient"
+        return "permanent"
+    # yt-dlp sin "HTTP Error NNN" (corte de red, fragmento perdido...): se reintenta hasta YTDLP_ATTEMPTS
+    return "transient" if isinstance(error, RETRYABLE_ERRORS + (YtDlpError,)) else "permanent"
+
+def retry_after_seconds(error):
+    response = getattr(error, "response", None)
+    value = response.headers.get("Retry-After") if response is not None and getattr(response, "headers", None) is not None else None
+    try: return float(value) if value else None
+    except ValueError: return None
+
+def host_of(url):
+    return urlparse(url).netloc or url
+
+class HostScheduler:
+    """
+    Token bucket por host compartido por la resolución de MPDs y las descargas. El ritmo sube
+    de forma aditiva con cada respuesta sana y se reduce a la mitad ante 429/503. `call` reintenta
+    los fallos transitorios con backoff exponencial y jitter, y deja pasar los permanentes.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _bucket(self, host):
+        bucket = self._hosts.get(host)
+        if bucket is None:
+            bucket = self._hosts[host] = {"rate": RATE_INITIAL_PER_HOST, "tokens": 1.0, "updated": time.monotonic(),
+                                          "ok": 0, "retries": 0, "throttled": 0, "failed": 0}
+        return bucket
+
+    def acquire(self, host):
+        while True:
+            with self._lock:
+                bucket = self._bucket(host)
+                now = time.monotonic()
+                bucket["tokens"] = min(max(1.0, bucket["rate"]), bucket["tokens"] + (now - bucket["updated"]) * bucket["rate"])
+                bucket["updated"] = now
+                if bucket["tokens"] >= 1:
+                    bucket["tokens"] -= 1
+                    return
+                wait = (1 - bucket["tokens"]) / bucket["rate"]
+            time.sleep(wait)
+
+    def report(self, host, outcome):
+        with self._lock:
+            bucket = self._bucket(host)
+            if outcome == "ok":
+                bucket["ok"] += 1
+                bucket["rate"] = min(RATE_MAX_PER_HOST, bucket["rate"] + RATE_INCREASE_STEP)
+            elif outcome == "throttled":
+                bucket["throttled"] += 1
+                bucket["rate"] = max(RATE_MIN_PER_HOST, bucket["rate"] * RATE_DECREASE_FACTOR)
+                bucket["tokens"] = 0.0
+            elif outcome == "retry": bucket["retries"] += 1
+            else: bucket["failed"] += 1
+
+    def _retry_delay(self, host, error, attempt, attempts, label):
+        # Segundos hasta el siguiente intento; relanza el error si no merece la pena reintentar.
+        kind = classify_error(error)
+        if kind == "permanent" or attempt == attempts - 1:
+            self.report(host, "failed"); raise error
+        self.report(host, "throttled" if kind == "throttled" else "retry")
+        delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)
+        retry_after = retry_after_seconds(error) # Un Retry-After enorme no bloquea el hilo más de RETRY_MAX_DELAY
+        delay = min(max(retry_after, 0.0), RETRY_MAX_DELAY) if retry_after else delay / 2 + random.uniform(0, delay / 2)
+        print(f"  [{host}] {label or 'petición'}: {error} ({kind}). Reintento {attempt + 2}/{attempts} en {delay:.1f}s.")
+        return delay
+
+    def call(self, host, fn, attempts=3, label=""):
+        for attempt in range(attempts):
+            self.acquire(host)
+            try: result = fn()
+            except Exception as error:
+                if DOWNLOAD_SHUTDOWN.wait(self._retry_delay(host, error, attempt, attempts, label)): raise # Ctrl-C: no seguir reintentando
+                continue
+            self.report(host, "ok")
+            return result
+
+    async def call_async(self, host, make_coro, attempts=3, label=""):
+        # Igual que `call` para corrutinas; la espera entre intentos se cancela con la tarea.
+        for attempt in range(attempts):
+            await asyncio.to_thread(self.acquire, host)
+            try: result = await make_coro()
+            except Exception as error:
+                await asyncio.sleep(self._retry_delay(host, error, attempt, attempts, label))
+                continue
+            self.report(host, "ok")
+            return result
+
+    def print_summary(self):
+        with self._lock: hosts = {h: dict(b) for h, b in self._hosts.items()}
+        if not hosts: return
+        print("\n--- Planificador por host ---")
+        for host, b in sorted(hosts.items()):
+            print(f"  {host:<40} ritmo {b['rate']:>6.1f}/s  ok {b['ok']:>6}  reintentos {b['retries']:>4}  429/503 {b['throttled']:>4}  fallidos {b['failed']:>4}")
+
+DOWNLOAD_SHUTDOWN = threading.Event() # Se activa con Ctrl-C: los hilos del navegador y de descarga paran (guardando su checkpoint)
+SCHEDULER = HostScheduler()
+
+# --- Parseo local de páginas (una sola pasada) ---
+# En lugar de una llamada a WebDriver por elemento, se toma el HTML una vez (driver.page_source
+# o HTTP) y se extrae todo localmente: JSON-LD, enlaces de series, temporadas y tarjetas de episodio.
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+
+class HtmlNode:
+    __slots__ = ("tag", "attrs", "children")
+
+    def __init__(self, tag, attrs):
+        self.tag, self.attrs, self.children = tag, attrs, []
+
+    def iter(self, tag=None):
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if tag is None or node.tag == tag: yield node
+            stack.extend(reversed([c for c in node.children if isinstance(c, HtmlNode)]))
+
+    def text(self):
+        parts, stack = [], [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str): parts.append(node); continue
+            stack.extend(reversed(node.children))
+        return " ".join("".join(parts).split())
+
+    def has_class(self, class_name):
+        # Misma semántica que HAS_CLASS_XPATH: clase completa, no subcadena del atributo
+        return class_name in self.attrs.get("class", "").split()
+
+class DmaxPageParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = HtmlNode("document", {})
+        self._stack = [self.root]
+
+    def handle_starttag(self, tag, attrs):
+        node = HtmlNode(tag, {k: v if v is not None else "" for k, v in attrs})
+        self._stack[-1].children.append(node)
+        if tag not in VOID_TAGS: self._stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        self._stack[-1].children.append(HtmlNode(tag, {k: v if v is not None else "" for k, v in attrs}))
+
+    def handle_endtag(self, tag):
+        for i in range(len(self._stack) - 1, 0, -1): # Tolera etiquetas sin cerrar
+            if self._stack[i].tag == tag: del self._stack[i:]; return
+
+    def handle_data(self, data):
+        self._stack[-1].children.append(data)
+
+def parse_dmax_page(page_html):
+    """
+    Extrae en una sola pasada lo que el resto del código necesita de una página de DMAX.
+    Las listas conservan el orden del documento, igual que los find_elements equivalentes.
+    """
+    parser = DmaxPageParser()
+    parser.feed(page_html or ""); parser.close()
+    page = {"json_ld": [], "series_links": [], "season_trigger": None, "season_options": [], "single_season_title": None, "episode_cards": []}
+    for node in parser.root.iter():
+        if node.tag == "script" and node.attrs.get("type") == "application/ld+json":
+            try: page["json_ld"].append(json.loads("".join(c for c in node.children if isinstance(c, str))))
+            except ValueError: pass # Ignorar errores de parseo de JSON individuales
+        elif node.tag == "li" and node.has_class("category-link__letter__list__item"):
+            for link in node.children:
+                if isinstance(link, HtmlNode) and link.tag == "a" and link.attrs.get("class") == "link":
+                    page["series_links"].append((link.text(), link.attrs.get("href", "")))
+        elif node.tag == "div":
+            if node.has_class("select__value") and "Temporada" in node.text() and page["season_trigger"] is None:
+                page["season_trigger"] = node.text()
+            elif node.has_class("select__option"): page["season_options"].append(node.text())
+            elif node.has_class("sonicshow__title") and page["single_season_title"] is None:
+                own_text = "".join(c for c in node.children if isinstance(c, str))
+                if "Temporada" in own_text: page["single_season_title"] = node.text()
+            if node.has_class("card--video"):
+                labelled = next((img for img in node.iter("img") if "aria-label" in img.attrs), None)
+                if labelled is None: continue # Igual que EPISODE_CARDS_XPATH: solo tarjetas con img[@aria-label]
+                heading = next(node.iter("h2"), None)
+                link = next((a for a in node.iter("a") if a.attrs.get("href")), None)
+                page["episode_cards"].append({
+                    "position": len(page["episode_cards"]), "aria_label": labelled.attrs["aria-label"].strip(),
+                    "h2": heading.text() if heading is not None else "", "href": link.attrs["href"] if link is not None else None,
+                })
+    for card in page["episode_cards"]:
+        card["title"] = card["aria_label"] or card["h2"] or f"Episodio sin título {card['position'] + 1}"
+    return page
+
+def series_slug_from_url(series_url):
+    return series_url.split('/series/')[-1].split('/')[0].split('?')[0]
+
+def extract_series_from_page(page):
+    series_data = {}
+    for json_content in page["json_ld"]:
+        if not isinstance(json_content, dict): continue
+        if json_content.get("@type") == "ItemList" and "itemListElement" in json_content:
+            for item_entry in json_content["itemListElement"]:
+                item_details = item_entry.get("item", {})
+                if item_details.get("@type") == "Webpage":
+                    series_name = item_details.get("name", "").strip()
+                    series_url = item_details.get("url", "")
+                    if series_name and series_url and "/series/" in series_url:
+                        slug = series_slug_from_url(series_url)
+                        if slug: series_data[series_name] = slug
+    # Complemento: estructura HTML de categorías
+    for series_name, series_url in page["series_links"]:
+        if series_name and series_url and "/series/" in series_url:
+            slug = series_slug_from_url(series_url)
+            if slug and series_name not in series_data: series_data[series_name] = slug
+    return dict(sorted(series_data.items()))
+
+# --- Resolución de MPD por HTTP (sin navegador) ---
+MPD_URL_REGEX = re.compile(r"https?:[^\s\"'<>]+?\.mpd(?:\?[^\s\"'<>]*)?")
+VIDEO_ID_REGEX = re.compile(r"(?:data-video-id|\"videoId\"|\"video_id\")\s*[=:]\s*[\"']?([\w-]+)")
+
+_http_session = None
+_http_session_lock = threading.Lock()
+_page_cache = {} # url -> (timestamp, texto)
+_page_cache_lock = threading.Lock()
+
+def get_http_session():
+    # Una única sesión con pool de conexiones, compartida entre hilos.
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=max(8, MAX_PARALLEL_DOWNLOADS * 2))
+            session.mount("http://", adapter); session.mount("https://", adapter)
+            session.headers.update({"User-Agent": USER_AGENT, "Accept-Language": "es-ES,es;q=0.9"})
+            _http_session = session
+        return _http_session
+
+def fetch_page_text(url):
+    now = time.time()
+    with _page_cache_lock:
+        cached = _page_cache.get(url)
+        if cached and now - cached[0] < HTTP_PAGE_CACHE_SECONDS: return cached[1]
+    def fetch():
+        resp = get_http_session().get(url, timeout=HTTP_TIMEOUT)
+        resp.raise_for_status()
+        return resp.text
+    text = SCHEDULER.call(host_of(url), fetch, label="página")
+    with _page_cache_lock: _page_cache[url] = (now, text)
+    return text
+
+def find_mpd_in_text(text):
+    # Las URLs pueden venir escapadas dentro de JSON ("\/") o de atributos HTML ("&amp;").
+    match = MPD_URL_REGEX.search(html.unescape(text.replace("\\/", "/")))
+    return match.group(0) if match else None
+
+def iter_json_nodes(obj):
+    if isinstance(obj, dict):
+        yield obj
+        for v in obj.values(): yield from iter_json_nodes(v)
+    elif isinstance(obj, list):
+        for v in obj: yield from iter_json_nodes(v)
+
+def parse_json_ld_blocks(page_html):
+    return parse_dmax_page(page_html)["json_ld"]
+
+def is_mpd_reachable(mpd_url, referer=None):
+    headers = {"Referer": referer} if referer else {}
+    def probe(): # Solo la respuesta: el cuerpo no se descarga
+        with get_http_session().get(mpd_url, headers=headers, timeout=HTTP_TIMEOUT, stream=True) as resp: resp.raise_for_status()
+    try: SCHEDULER.call(host_of(mpd_url), probe, label="comprobación de MPD"); return True
+    except requests.RequestException: return False
+
+def resolve_mpd_via_http(series_url, episode_title, episode_url=None):
+    """
+    Intenta obtener la URL del MPD sin navegador: busca el episodio en el JSON-LD de la serie,
+    después en la página del episodio y, si está configurado, en el JSON de reproducción.
+    Devuelve la URL del MPD o None para que el llamador recurra a Selenium.
+    """
+    try:
+        candidate_pages = [episode_url] if episode_url else []
+        series_html = fetch_page_text(series_url)
+        for block in parse_json_ld_blocks(series_html):
+            for node in iter_json_nodes(block):
+                if str(node.get("name", "")).strip() != episode_title: continue
+                for key in ("contentUrl", "embedUrl", "url"):
+                    value = node.get(key)
+                    if not isinstance(value, str): continue
+                    if MPD_URL_IDENTIFIER in value and is_mpd_reachable(value, series_url): return value
+                    if value.startswith("http") and value not in candidate_pages: candidate_pages.append(value)
+
+        for page_url in candidate_pages:
+            page_html = fetch_page_text(page_url)
+            mpd_url = find_mpd_in_text(page_html)
+            if mpd_url and is_mpd_reachable(mpd_url, series_url): return mpd_url
+            video_id_match = VIDEO_ID_REGEX.search(page_html)
+            if video_id_match and PLAYBACK_API_URL_TEMPLATE:
+                api_url = PLAYBACK_API_URL_TEMPLATE.format(video_id=video_id_match.group(1))
+                def fetch_playback():
+                    resp = get_http_session().get(api_url, headers={"Referer": page_url}, timeout=HTTP_TIMEOUT)
+                    resp.raise_for_status()
+                    return resp.text
+                try: mpd_url = find_mpd_in_text(SCHEDULER.call(host_of(api_url), fetch_playback, label="API de reproducción"))
+                except requests.RequestException: continue # Se prueba la siguiente página candidata
+                if mpd_url: return mpd_url
+    except (requests.RequestException, ValueError) as e:
+        print(f"  Resolución HTTP de '{episode_title}' fallida: {e}")
+    return None
+
+# --- Catálogo en disco (series, temporadas, episodios y MPDs) ---
+_catalog_conn = None
+_catalog_lock = threading.Lock()
+
+def get_catalog():
+    global _catalog_conn
+    if _catalog_conn is None:
+        os.makedirs(os.path.dirname(CATALOG_DB_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(CATALOG_DB_PATH, check_same_thread=False)
+        conn.create_function("season_recency", 1, season_recency, deterministic=True) # Para la regla "recientes"
+        conn.execute("""CREATE TABLE IF NOT EXISTS catalog (
+            kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,
+            fetched_at REAL NOT NULL, last_used REAL NOT NULL,
+            PRIMARY KEY (kind, key))""")
+        conn.execute("""CREATE TABLE IF NOT EXISTS mirror_queue (
+            kind TEXT NOT NULL, series TEXT NOT NULL, season TEXT NOT NULL DEFAULT '', episode TEXT NOT NULL DEFAULT '',
+            season_num INTEGER NOT NULL DEFAULT 0, position INTEGER NOT NULL DEFAULT 0, season_size INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, size INTEGER, error TEXT,
+            updated_at REAL NOT NULL, PRIMARY KEY (kind, series, season, episode))""")
+        conn.execute("""CREATE TABLE IF NOT EXISTS content_index (
+            path TEXT PRIMARY KEY, asset_id TEXT, sha256 TEXT NOT NULL, size INTEGER NOT NULL,
+            duration REAL, expected_duration REAL, mpd_url TEXT, indexed_at REAL NOT NULL)""")
+        conn.execute("CREATE INDEX IF NOT EXISTS content_index_asset ON content_index (asset_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS content_index_sha256 ON content_index (sha256)")
+        conn.commit()
+        _catalog_conn = conn
+    return _catalog_conn
+
+def catalog_key(*parts):
+    return "|".join(str(p) for p in parts)
+
+def catalog_get(kind, key):
+    # Devuelve el valor solo si no ha caducado según CATALOG_TTL[kind].
+    with _catalog_lock:
+        conn = get_catalog()
+        row = conn.execute("SELECT value, fetched_at FROM catalog WHERE kind=? AND key=?", (kind, key)).fetchone()
+        if not row or time.time() - row[1] > CATALOG_TTL[kind]: return None
+        conn.execute("UPDATE catalog SET last_used=? WHERE kind=? AND key=?", (time.time(), kind, key))
+        conn.commit()
+        return json.loads(row[0])
+
+def catalog_put(kind, key, value):
+    now = time.time()
+    with _catalog_lock:
+        conn = get_catalog()
+        conn.execute("INSERT OR REPLACE INTO catalog (kind, key, value, fetched_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                     (kind, key, json.dumps(value), now, now))
+        conn.commit()
+
+def catalog_delete(kind, key):
+    with _catalog_lock:
+        conn = get_catalog()
+        conn.execute("DELETE FROM catalog WHERE kind=? AND key=?", (kind, key))
+        conn.commit()
+
+def catalog_expired_entries(kind):
+    with _catalog_lock:
+        rows = get_catalog().execute("SELECT key, value FROM catalog WHERE kind=? AND fetched_at < ?",
+                                     (kind, time.time() - CATALOG_TTL[kind])).fetchall()
+    return [(key, json.loads(value)) for key, value in rows]
+
+def catalog_evict():
+    now = time.time()
+    with _catalog_lock:
+        conn = get_catalog()
+        removed = 0
+        for kind, ttl in CATALOG_TTL.items():
+            removed += conn.execute("DELETE FROM catalog WHERE kind=? AND fetched_at < ?",
+                                    (kind, now - ttl - CATALOG_STALE_GRACE)).rowcount
+        total = conn.execute("SELECT COUNT(*) FROM catalog").fetchone()[0]
+        if total > CATALOG_MAX_ENTRIES:
+            removed += conn.execute("DELETE FROM catalog WHERE rowid IN (SELECT rowid FROM catalog ORDER BY last_used LIMIT ?)",
+                                    (total - CATALOG_MAX_ENTRIES,)).rowcount
+        conn.commit()
+    if removed: print(f"Catálogo: {removed} entradas antiguas eliminadas.")
+
+# --- Esperas por condición y presupuesto de latencia ---
+JS_XPATH_COUNT = "return document.evaluate(arguments[0], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null).snapshotLength;"
+JS_XPATH_TEXT = "var el = document.evaluate(arguments[0], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue; return el ? el.textContent : '';"
+# Instala (una vez por página) un MutationObserver y devuelve los ms desde la última mutación.
+JS_DOM_QUIET_MS = """
+if (!window.__dmaxLastMutation) {
+    window.__dmaxLastMutation = performance.now();
+    new MutationObserver(function() { window.__dmaxLastMutation = performance.now(); })
+        .observe(document.documentElement, {childList: true, subtree: true});
+}
+return performance.now() - window.__dmaxLastMutation;
+"""
+JS_RESOURCE_COUNT = """
+if (!window.__dmaxResourceBuffer) { performance.setResourceTimingBufferSize(100000); window.__dmaxResourceBuffer = true; }
+return document.readyState === 'complete' ? performance.getEntriesByType('resource').length : -1;
+"""
+
+_latency_lock = threading.Lock()
+_latency_stats = {} # fase -> [(segundos, cumplida)]
+
+def record_wait(phase, seconds, satisfied=True):
+    with _latency_lock: _latency_stats.setdefault(phase, []).append((seconds, satisfied))
+    budget = LATENCY_BUDGETS.get(phase)
+    if budget is not None and seconds > budget:
+        print(f"  [latencia] '{phase}' tardó {seconds:.2f}s (presupuesto {budget}s){'' if satisfied else ' y no se cumplió la condición'}.")
+
+def wait_until(driver, phase, condition, timeout=READY_WAIT_TIMEOUT):
+    # Espera por condición sin lanzar excepción: devuelve si se cumplió y registra el tiempo de la fase.
+    start = time.monotonic()
+    def condition_or_shutdown(d):
+        if DOWNLOAD_SHUTDOWN.is_set(): raise DownloadInterrupted("parada pedida") # Ctrl-C no espera al timeout
+        return condition(d)
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=WAIT_POLL_INTERVAL).until(condition_or_shutdown)
+        satisfied = True
+    except TimeoutException: satisfied = False
+    record_wait(phase, time.monotonic() - start, satisfied)
+    return satisfied
+
+def stable_value(get_value, stable_for, accept=lambda v: True):
+    # Condición que se cumple cuando get_value(driver) no cambia durante `stable_for` segundos.
+    state = {"value": None, "since": time.monotonic()}
+    def condition(driver):
+        value, now = get_value(driver), time.monotonic()
+        if value != state["value"] or not accept(value):
+            state["value"], state["since"] = value, now
+            return False
+        return now - state["since"] >= stable_for
+    return condition
+
+def dom_quiet_ms(driver):
+    return driver.execute_script(JS_DOM_QUIET_MS)
+
+def xpath_count(driver, xpath):
+    return driver.execute_script(JS_XPATH_COUNT, xpath)
+
+def wait_for_dom_settled(driver, phase, quiet_ms=DOM_QUIET_MS, timeout=READY_WAIT_TIMEOUT):
+    return wait_until(driver, phase, lambda d: dom_quiet_ms(d) >= quiet_ms, timeout)
+
+def wait_for_count_stable(driver, phase, xpath, timeout=READY_WAIT_TIMEOUT):
+    return wait_until(driver, phase, stable_value(lambda d: xpath_count(d, xpath), COUNT_STABLE_SECONDS, accept=lambda n: n > 0), timeout)
+
+def wait_for_network_idle(driver, phase, timeout=READY_WAIT_TIMEOUT):
+    return wait_until(driver, phase, stable_value(lambda d: d.execute_script(JS_RESOURCE_COUNT), NETWORK_IDLE_MS / 1000, accept=lambda n: n >= 0), timeout)
+
+def first_episode_card(driver):
+    cards = driver.find_elements(By.XPATH, EPISODE_CARDS_XPATH)
+    return cards[0] if cards else None
+
+def wait_for_season_loaded(driver, season_text, old_card=None):
+    # Tras elegir temporada: el desplegable muestra la nueva, las tarjetas de la anterior (`old_card`, tomada antes
+    # del clic) ya no están, el DOM está quieto y el número de tarjetas no cambia. La etiqueta cambia antes que las tarjetas.
+    season_label = season_text.split('(')[0].strip()
+    old_cards_gone = EC.staleness_of(old_card) if old_card is not None else (lambda d: True)
+    cards_stable = stable_value(lambda d: xpath_count(d, EPISODE_CARDS_XPATH), COUNT_STABLE_SECONDS, accept=lambda n: n > 0)
+    def condition(d):
+        return (season_label in (d.execute_script(JS_XPATH_TEXT, SEASON_TRIGGER_XPATH) or "") and old_cards_gone(d)
+                and dom_quiet_ms(d) >= DOM_QUIET_MS and cards_stable(d))
+    return wait_until(driver, "season_switch", condition, SELENIUM_TIMEOUT)
+
+def report_latency_budget():
+    with _latency_lock: stats = {phase: list(samples) for phase, samples in _latency_stats.items()}
+    if not stats: return
+    print("\n--- Presupuesto de latencia por fase ---")
+    print(f"  {'fase':<16}{'n':>5}{'total':>9}{'máx':>8}{'presup.':>9}  estado")
+    for phase, samples in sorted(stats.items()):
+        durations = [d for d, _ in samples]
+        budget = LATENCY_BUDGETS.get(phase)
+        over = budget is not None and max(durations) > budget
+        unmet = sum(1 for _, ok in samples if not ok)
+        status = ("EXCEDIDO" if over else "ok") + (f", {unmet} sin cumplir" if unmet else "")
+        budget_txt = f"{budget}s" if budget is not None else "-"
+        print(f"  {phase:<16}{len(samples):>5}{sum(durations):>8.1f}s{max(durations):>7.2f}s{budget_txt:>9}  {status}")
+
 # --- Funciones de Interacción con DMAX ---
 def accept_cookies(driver):
+    if getattr(driver, 'cookies_checked', False): return # Solo una vez por sesión de navegador
+    driver.cookies_checked = True
     print("Intentando aceptar cookies...")
     try:
-        cookie_button_xpath = "//button[contains(text(), 'ACEPTAR TODO') or contains(text(), 'Aceptar y cerrar') or @id='onetrust-accept-btn-handler']"
-        WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.XPATH, cookie_button_xpath))).click()
-        print("Banner de cookies aceptado."); time.sleep(2)
+        # Esperar a que aparezca el banner o a que la página se quede quieta sin él
+        wait_until(driver, "cookies", lambda d: xpath_count(d, COOKIE_BUTTON_XPATH) > 0 or
+                   (d.execute_script('return document.readyState') == 'complete' and dom_quiet_ms(d) >= COOKIE_BANNER_GRACE_MS), 10)
+        if not xpath_count(driver, COOKIE_BUTTON_XPATH): print("No se encontró banner de cookies o ya fue aceptado."); return
+        WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.XPATH, COOKIE_BUTTON_XPATH))).click()
+        wait_until(driver, "cookies", EC.invisibility_of_element_located((By.XPATH, COOKIE_BUTTON_XPATH)), 5)
+        print("Banner de cookies aceptado.")
     except TimeoutException: print("No se encontró banner de cookies (Timeout) o ya fue aceptado.")
     except Exception as e_cookie: print(f"Error aceptando cookies: {e_cookie}")
 
+@timed_phase("series_list", result_fields=lambda result, *a, **kw: {"count": len(result)})
 def get_all_series(driver):
-    series_page_url = "https://dmax.marca.com/series"
+    series_page_url = f"{DMAX_BASE_URL}/series"
     print(f"\nObteniendo lista de todas las series desde: {series_page_url}...")
     driver.get(series_page_url)
     # La aceptación de cookies puede ser necesaria aquí si el banner cubre los scripts JSON-LD
@@ -86,91 +966,83 @@ def get_all_series(driver):
     WebDriverWait(driver, SELENIUM_TIMEOUT).until(
         lambda d: d.execute_script('return document.readyState') == 'complete'
     )
-    time.sleep(2) # Pausa adicional para que carguen los scripts JSON-LD
+    wait_for_network_idle(driver, "series_list") # Scripts JSON-LD y listado cargados
 
     series_data = {}
     try:
-        json_ld_scripts = driver.find_elements(By.XPATH, "//script[@type='application/ld+json']")
-        if not json_ld_scripts:
-            print("  No se encontraron scripts JSON-LD para la lista de series inicial.")
-        
-        for script_tag in json_ld_scripts:
-            try:
-                json_content = json.loads(script_tag.get_attribute('innerHTML'))
-                if json_content.get("@type") == "ItemList" and "itemListElement" in json_content:
-                    for item_entry in json_content["itemListElement"]:
-                        item_details = item_entry.get("item", {})
-                        if item_details.get("@type") == "Webpage":
-                            series_name = item_details.get("name", "").strip()
-                            series_url = item_details.get("url", "")
-                            if series_name and series_url and "/series/" in series_url:
-                                slug = series_url.split('/series/')[-1].split('/')[0].split('?')[0]
-                                if slug: series_data[series_name] = slug
-            except: continue # Ignorar errores de parseo de JSON individuales
-
-        # Fallback si JSON-LD no dio resultados o para complementar
-        print("  Buscando series en estructura HTML de categoría (fallback/complemento)...")
-        category_links = driver.find_elements(By.XPATH, "//li[contains(@class, 'category-link__letter__list__item')]/a[@class='link']")
-        for link_el in category_links:
-            series_name = link_el.text.strip()
-            series_url = link_el.get_attribute('href')
-            if series_name and series_url and "/series/" in series_url:
-                slug = series_url.split('/series/')[-1].split('/')[0].split('?')[0]
-                if slug and series_name not in series_data: # Añadir si no está ya
-                    series_data[series_name] = slug
-        
+        page = parse_dmax_page(driver.page_source) # Una sola llamada a WebDriver para toda la página
+        if not page["json_ld"]: print("  No se encontraron scripts JSON-LD para la lista de series inicial.")
+        series_data = extract_series_from_page(page)
         if series_data: print(f"  Se encontraron {len(series_data)} series en total.")
         else: print("  No se pudo extraer ninguna serie.")
-            
     except Exception as e: print(f"Error obteniendo la lista de series: {e}")
-    return dict(sorted(series_data.items()))
+    return series_data
 
+@timed_phase("series_list_http", result_fields=lambda result, *a, **kw: {"count": len(result)})
+def get_all_series_http():
+    # Sin navegador: mismo parseo sobre el HTML servido. Vacío si la lista se genera con JavaScript.
+    try: series_data = extract_series_from_page(parse_dmax_page(fetch_page_text(f"{DMAX_BASE_URL}/series")))
+    except requests.RequestException as e: print(f"  Lista de series por HTTP no disponible: {e}"); return {}
+    if series_data: print(f"\nSe encontraron {len(series_data)} series por HTTP (sin navegador).")
+    return series_data
 
-def select_season_interactive(driver, current_series_url):
+def get_all_series_cached(get_driver, use_cache=True):
+    series_map = catalog_get("series", "all") if use_cache else None
+    if series_map: print(f"\nLista de {len(series_map)} series tomada del catálogo."); return series_map
+    series_map = get_all_series_http() or get_all_series(get_driver())
+    if series_map: catalog_put("series", "all", series_map)
+    return series_map
+
+
+@timed_phase("season_select", fields=lambda driver, url, target_season=None: {"series": url.rstrip('/').split('/')[-1]},
+             result_fields=lambda result, *a, **kw: {"season": result})
+def select_season_interactive(driver, current_series_url, target_season=None):
     """
-    Navega a la página de la serie. Si hay múltiples temporadas, permite seleccionar una.
+    Navega a la página de la serie. Si hay múltiples temporadas, permite seleccionar una
+    (o selecciona `target_season` sin preguntar, si se indica).
     Si solo hay una temporada (sin selector), la detecta y la devuelve.
     Devuelve el texto de la temporada seleccionada/detectada (ej. "Temporada 1") o None.
     """
-    print(f"\n--- Selección/Detección de Temporada para {current_series_url.split('/')[-1]} ---")
+    series_slug = current_series_url.rstrip('/').split('/')[-1]
+    print(f"\n--- Selección/Detección de Temporada para {series_slug} ---")
     # No es necesario volver a cargar la URL si ya estamos en ella,
     # pero por consistencia y para asegurar el estado correcto, lo hacemos.
     if driver.current_url != current_series_url:
         print(f"  Navegando a: {current_series_url}")
         driver.get(current_series_url)
-        # accept_cookies(driver) # Ya debería estar aceptado de la llamada en main()
+        accept_cookies(driver) # No hace nada si ya se aceptaron en esta sesión
 
     wait = WebDriverWait(driver, SELENIUM_TIMEOUT)
 
-    # Intentar encontrar el selector de temporadas múltiples
-    season_dropdown_trigger_xpath = "//div[contains(@class, 'select__value') and contains(., 'Temporada')]"
+    # Selector de temporadas múltiples o título de temporada única, lo que aparezca primero
+    s_trigger = wait_for_season_selector(driver)
+    if s_trigger is None: return detect_single_season(driver, series_slug, timeout=0)
     try:
-        s_trigger = wait.until(EC.visibility_of_element_located((By.XPATH, season_dropdown_trigger_xpath)))
         print("  Selector de temporadas múltiples encontrado.")
         default_season_text = s_trigger.text.strip()
         
-        # Comprobar si el texto actual ya es el que queremos (en caso de que solo haya una opción o sea la correcta)
-        # Esto es más relevante si pasáramos un `TARGET_SEASON_INPUT` a esta función.
-        # Por ahora, siempre mostramos las opciones.
-
         print(f"  Abriendo selector (actual: '{default_season_text}')...")
         driver.execute_script("arguments[0].click();", s_trigger)
-        time.sleep(1.5)
+        wait_for_count_stable(driver, "season_options", SEASON_OPTIONS_XPATH)
 
-        s_options_xpath = "//div[contains(@class, 'select__option')]"
-        s_elements = wait.until(EC.presence_of_all_elements_located((By.XPATH, s_options_xpath)))
-        
-        available_s_texts = [el.text.strip() for el in s_elements if el.text.strip()]
+        s_elements = wait.until(EC.presence_of_all_elements_located((By.XPATH, SEASON_OPTIONS_XPATH)))
+        season_options = read_season_options(driver, s_elements)
+        available_s_texts = [text for _, text in season_options]
         if not available_s_texts:
             print(f"  No se encontraron opciones en el desplegable. Usando por defecto: '{default_season_text}'")
             if "Temporada" in default_season_text: return default_season_text
             return None # No hay opciones ni un default válido
+        catalog_put("seasons", series_slug, available_s_texts)
 
         print("  Temporadas disponibles:")
         for i, s_text in enumerate(available_s_texts): print(f"    {i+1}. {s_text}")
         
         while True:
-            choice = input(f"  Elige temporada (1-{len(available_s_texts)}), o 'q' para salir: ")
+            if target_season is not None:
+                target_idx = find_season_index(available_s_texts, target_season)
+                if target_idx is None: print(f"  Temporada '{target_season}' no disponible.")
+                choice = 'q' if target_idx is None else str(target_idx + 1)
+            else: choice = input(f"  Elige temporada (1-{len(available_s_texts)}), o 'q' para salir: ")
             if choice.lower() == 'q': 
                 try: driver.execute_script("arguments[0].click();", s_trigger) # Intentar cerrar
                 except: pass
@@ -181,81 +1053,168 @@ def select_season_interactive(driver, current_series_url):
                     selected_s_text = available_s_texts[num-1]
                     # Verificar si el desplegable sigue abierto y si el elemento es clickeable
                     target_season_el = WebDriverWait(driver, 5).until(
-                        EC.element_to_be_clickable(s_elements[num-1])
+                        EC.element_to_be_clickable(season_options[num-1][0])
                     )
                     print(f"  Seleccionando '{selected_s_text}'...")
+                    # Las tarjetas visibles son de la temporada que ya estaba elegida: no pueden darse por cargadas
+                    old_card = None if find_season_index([default_season_text], selected_s_text) == 0 else first_episode_card(driver)
                     driver.execute_script("arguments[0].click();", target_season_el)
-                    time.sleep(8); return selected_s_text
+                    wait_for_season_loaded(driver, selected_s_text, old_card); return selected_s_text
                 else: print("  Número fuera de rango.")
             except ValueError: print("  Entrada inválida.")
             except TimeoutException:
                 print("  Timeout: La opción de temporada no era clickeable (quizás el desplegable se cerró). Reintentando abrir...")
                 # Intentar reabrir el desplegable y re-seleccionar
                 try:
-                    s_trigger_reopen = wait.until(EC.element_to_be_clickable((By.XPATH, season_dropdown_trigger_xpath)))
+                    s_trigger_reopen = wait.until(EC.element_to_be_clickable((By.XPATH, SEASON_TRIGGER_XPATH)))
                     driver.execute_script("arguments[0].click();", s_trigger_reopen)
-                    time.sleep(1)
+                    wait_for_count_stable(driver, "season_options", SEASON_OPTIONS_XPATH)
                     # Re-localizar el elemento específico
-                    s_elements_re = wait.until(EC.presence_of_all_elements_located((By.XPATH, s_options_xpath)))
+                    s_elements_re = wait.until(EC.presence_of_all_elements_located((By.XPATH, SEASON_OPTIONS_XPATH)))
                     target_season_el_re = WebDriverWait(driver, 5).until(
-                        EC.element_to_be_clickable(s_elements_re[num-1]) # Usar 'num' del intento anterior
+                        EC.element_to_be_clickable(read_season_options(driver, s_elements_re)[num-1][0]) # Usar 'num' del intento anterior
                     )
                     print(f"  Re-seleccionando '{selected_s_text}'...")
+                    old_card = None if find_season_index([default_season_text], selected_s_text) == 0 else first_episode_card(driver)
                     driver.execute_script("arguments[0].click();", target_season_el_re)
-                    time.sleep(8); return selected_s_text
+                    wait_for_season_loaded(driver, selected_s_text, old_card); return selected_s_text
                 except Exception as e_reselect:
                     print(f"  Fallo al re-seleccionar temporada: {e_reselect}")
                     return None
 
 
-    except TimeoutException: # El selector de temporadas múltiples no se encontró
-        print("  No se encontró selector de temporadas múltiples. Verificando si es una serie con temporada única...")
-        single_season_title_xpath = "//div[contains(@class, 'sonicshow__title') and contains(text(), 'Temporada')]"
-        try:
-            single_season_el = wait.until(EC.visibility_of_element_located((By.XPATH, single_season_title_xpath)))
-            season_text_from_title = single_season_el.text.strip()
-            # Extraer solo la parte "Temporada X"
-            match = re.search(r"(Temporada\s*\d+)", season_text_from_title)
-            if match:
-                detected_season = match.group(1)
-                print(f"  Detectada temporada única: '{detected_season}' (de '{season_text_from_title}')")
-                # No hay que hacer clic, ya está seleccionada por defecto.
-                time.sleep(1) # Pequeña pausa por consistencia
-                return detected_season
-            else:
-                print(f"  Se encontró título de sección, pero no se pudo extraer info de temporada: '{season_text_from_title}'")
-                return None
-        except TimeoutException:
-            print("  No se encontró título de temporada única. La estructura de la página puede ser diferente o no hay episodios.")
-            # driver.save_screenshot("error_no_season_selector_or_title.png")
-            return None
-        except Exception as e_single:
-            print(f"  Error detectando temporada única: {e_single}")
-            return None
+    except TimeoutException: # El desplegable estaba pero sus opciones no llegaron a cargar
+        print("  No cargaron las opciones del selector de temporadas. Verificando si es una serie con temporada única...")
+        return detect_single_season(driver, series_slug, timeout=0)
             
     except Exception as e_multi:
         print(f"  Error general obteniendo/seleccionando temporadas (múltiples): {e_multi}")
         return None
+
+def wait_for_season_selector(driver):
+    # Una sola espera para los dos tipos de página: devuelve el desplegable de temporadas, o None si lo que
+    # aparece es el título de temporada única (o nada en SELENIUM_TIMEOUT).
+    try:
+        found = WebDriverWait(driver, SELENIUM_TIMEOUT).until(EC.any_of(
+            EC.visibility_of_element_located((By.XPATH, SEASON_TRIGGER_XPATH)),
+            EC.visibility_of_element_located((By.XPATH, SINGLE_SEASON_TITLE_XPATH))))
+    except TimeoutException: return None
+    if "select__value" in (found.get_attribute("class") or "").split(): return found
+    print("  No hay selector de temporadas múltiples: serie con temporada única.")
+    return None
+
+def detect_single_season(driver, series_slug, timeout=SELENIUM_TIMEOUT):
+    # timeout=0: el título ya debería estar (wait_for_season_selector ya ha esperado); se comprueba una vez.
+    wait = WebDriverWait(driver, timeout)
+    try:
+        single_season_el = wait.until(EC.visibility_of_element_located((By.XPATH, SINGLE_SEASON_TITLE_XPATH)))
+        season_text_from_title = single_season_el.text.strip()
+        # Extraer solo la parte "Temporada X"
+        match = re.search(r"(Temporada\s*\d+)", season_text_from_title)
+        if match:
+            detected_season = match.group(1)
+            print(f"  Detectada temporada única: '{detected_season}' (de '{season_text_from_title}')")
+            catalog_put("seasons", series_slug, [detected_season])
+            # No hay que hacer clic, ya está seleccionada por defecto; basta con que carguen las tarjetas.
+            wait_for_count_stable(driver, "season_single", EPISODE_CARDS_XPATH)
+            return detected_season
+        else:
+            print(f"  Se encontró título de sección, pero no se pudo extraer info de temporada: '{season_text_from_title}'")
+            return None
+    except TimeoutException:
+        print("  No se encontró título de temporada única. La estructura de la página puede ser diferente o no hay episodios.")
+        # driver.save_screenshot("error_no_season_selector_or_title.png")
+        return None
+    except Exception as e_single:
+        print(f"  Error detectando temporada única: {e_single}")
+        return None
+
+def list_seasons(driver, current_series_url):
+    """
+    Devuelve las temporadas disponibles de una serie sin seleccionar ninguna
+    (abre y vuelve a cerrar el desplegable). Para modo no interactivo.
+    """
+    series_slug = current_series_url.rstrip('/').split('/')[-1]
+    if driver.current_url != current_series_url:
+        driver.get(current_series_url)
+        accept_cookies(driver)
+    wait = WebDriverWait(driver, SELENIUM_TIMEOUT)
+    s_trigger = wait_for_season_selector(driver)
+    if s_trigger is None:
+        detected_season = detect_single_season(driver, series_slug, timeout=0)
+        return [detected_season] if detected_season else []
+    try:
+        driver.execute_script("arguments[0].click();", s_trigger)
+        wait_for_count_stable(driver, "season_options", SEASON_OPTIONS_XPATH)
+        s_elements = wait.until(EC.presence_of_all_elements_located((By.XPATH, SEASON_OPTIONS_XPATH)))
+        available_s_texts = [text for _, text in read_season_options(driver, s_elements)]
+        try: driver.execute_script("arguments[0].click();", s_trigger) # Cerrar
+        except: pass
+        if not available_s_texts and "Temporada" in s_trigger.text: available_s_texts = [s_trigger.text.strip()]
+        if available_s_texts: catalog_put("seasons", series_slug, available_s_texts)
+        return available_s_texts
+    except TimeoutException:
+        detected_season = detect_single_season(driver, series_slug, timeout=0)
+        return [detected_season] if detected_season else []
+
+def read_season_options(driver, s_elements):
+    # Textos de las opciones con un único page_source; [(elemento, texto)] sin las opciones vacías.
+    texts = parse_dmax_page(driver.page_source)["season_options"]
+    if len(texts) != len(s_elements): texts = [el.text.strip() for el in s_elements] # Estructura inesperada
+    return [(el, text) for el, text in zip(s_elements, texts) if text]
+
+def find_season_index(season_texts, target_season):
+    # Coincidencia exacta o por número ("Temporada 2" encaja con "Temporada 2 (2023)", no con "Temporada 12").
+    for i, s_text in enumerate(season_texts):
+        if s_text == target_season: return i
+    target_match = re.search(r"Temporada\s*(\d+)", target_season)
+    if not target_match: return None
+    for i, s_text in enumerate(season_texts):
+        s_match = re.search(r"Temporada\s*(\d+)", s_text)
+        if s_match and int(s_match.group(1)) == int(target_match.group(1)): return i
+    return None
+
+def get_episode_title(card_el, index):
+    try:
+        img = WebDriverWait(card_el, 2).until(EC.presence_of_element_located((By.XPATH, ".//img[@aria-label]")))
+        return img.get_attribute("aria-label").strip()
+    except:
+        try: h2 = WebDriverWait(card_el, 1).until(EC.presence_of_element_located((By.XPATH, ".//h2"))); return h2.text.strip()
+        except: return f"Episodio sin título {index+1}"
+
+def get_episode_titles(episode_elements, driver=None):
+    # Con driver, un único page_source parseado localmente; si no cuadra con las tarjetas, una consulta por tarjeta.
+    if driver is not None:
+        cards = parse_dmax_page(driver.page_source)["episode_cards"]
+        if len(cards) == len(episode_elements): return [card["title"] for card in cards]
+    return [get_episode_title(card_el, i) for i, card_el in enumerate(episode_elements)]
+
 def get_episode_elements_for_current_season(driver):
     wait = WebDriverWait(driver, SELENIUM_TIMEOUT)
     print("  Obteniendo lista de episodios para la temporada actual...")
-    ep_cards_xpath = "//div[contains(@class, 'card--video')][.//img[@aria-label]]"
     try:
-        wait.until(EC.visibility_of_element_located((By.XPATH, ep_cards_xpath)))
-        ep_elements = driver.find_elements(By.XPATH, ep_cards_xpath)
+        wait.until(EC.visibility_of_element_located((By.XPATH, EPISODE_CARDS_XPATH)))
+        ep_elements = driver.find_elements(By.XPATH, EPISODE_CARDS_XPATH)
         print(f"    Encontrados {len(ep_elements)} elementos de episodio.")
         return ep_elements
     except: print("    No se encontraron tarjetas de episodio."); return []
 
-def click_episode_and_get_mpd(driver, episode_card_element, episode_title_for_log=""):
-    wait = WebDriverWait(driver, SELENIUM_TIMEOUT)
+@timed_phase("mpd_click", fields=lambda driver, card, title="", series_url=None: {"episode": title or None})
+def click_episode_and_get_mpd(driver, episode_card_element, episode_title_for_log="", series_url=None):
     log_prefix = f"Episodio '{episode_title_for_log}': " if episode_title_for_log else ""
+    if FAST_MPD_RESOLVER and series_url and episode_title_for_log:
+        # Ruta rápida: sin clic ni espera de red en el navegador.
+        try: episode_url = driver.execute_script("var a = arguments[0].querySelector('a[href]'); return a ? a.href : null;", episode_card_element)
+        except Exception: episode_url = None
+        mpd_url = resolve_mpd_via_http(series_url, episode_title_for_log, episode_url)
+        if mpd_url: print(f"{log_prefix}¡MPD encontrado por HTTP!: {mpd_url}"); return mpd_url
+        print(f"{log_prefix}Resolución HTTP sin resultado. Usando el navegador...")
     try:
         print(f"{log_prefix}Asegurando visibilidad y preparando para clic...")
         driver.execute_script("arguments[0].scrollIntoView({block: 'center', inline: 'nearest'});", episode_card_element)
-        time.sleep(0.5); wait.until(EC.visibility_of(episode_card_element))
+        wait_until(driver, "episode_click", EC.visibility_of(episode_card_element), SELENIUM_TIMEOUT)
 
-        play_button_xpath = ".//div[contains(@class, 'card__placeholder')]"
+        play_button_xpath = f".//div[{HAS_CLASS_XPATH.format('card__placeholder')}]"
         element_for_final_click = episode_card_element # Por defecto
         try:
             play_button = WebDriverWait(episode_card_element, 3).until(EC.element_to_be_clickable((By.XPATH, play_button_xpath)))
@@ -272,40 +1231,1204 @@ def click_episode_and_get_mpd(driver, episode_card_element, episode_title_for_lo
                 print(f"{log_prefix}  Interceptor 'grid__content' detectado. Neutralizando...")
                 try:
                     driver.execute_script("arguments[0].style.pointerEvents = 'none';", elem_at_center_js)
-                    print(f"{log_prefix}    'grid__content' cambiado a pointer-events: none."); time.sleep(0.3)
+                    print(f"{log_prefix}    'grid__content' cambiado a pointer-events: none.")
                 except Exception as e_neut: print(f"{log_prefix}    Error neutralizando: {e_neut}")
         
-        if hasattr(driver, 'requests'): del driver.requests
-        else: print(f"{log_prefix}ADVERTENCIA: 'requests' no en driver."); return None
+        capture = getattr(driver, 'mpd_capture', None)
+        if capture is None: print(f"{log_prefix}ADVERTENCIA: captura de MPD no instalada en el driver."); return None
+        capture.reset()
+        if hasattr(driver, 'requests'): del driver.requests # Solo contiene manifiestos gracias a scopes
 
         print(f"{log_prefix}Intentando clic JS en: {element_for_final_click.tag_name}.{element_for_final_click.get_attribute('class')}")
         driver.execute_script("arguments[0].click();", element_for_final_click)
-        print(f"{log_prefix}Clic JS supuestamente realizado."); time.sleep(2)
+        print(f"{log_prefix}Clic JS supuestamente realizado.")
 
         print(f"{log_prefix}Esperando MPD ({WAIT_FOR_MPD_TIMEOUT}s)...")
-        start_time = time.time()
-        for _ in range(int(WAIT_FOR_MPD_TIMEOUT / 0.5)): # Bucle con timeout
-            if hasattr(driver, 'requests'):
-                for r in driver.requests:
-                    if MPD_URL_IDENTIFIER in r.url and r.response and 200 <= r.response.status_code < 300:
-                        print(f"{log_prefix}¡MPD encontrado!: {r.url}"); return r.url
-            time.sleep(0.5)
+        capture_start = time.monotonic()
+        mpd_url = capture.wait(WAIT_FOR_MPD_TIMEOUT)
+        record_wait("mpd_capture", time.monotonic() - capture_start, mpd_url is not None)
+        if mpd_url: print(f"{log_prefix}¡MPD encontrado!: {mpd_url}"); return mpd_url
         print(f"{log_prefix}No se encontró MPD."); return None
     except Exception as e: print(f"{log_prefix}Error en clic/MPD: {e}"); return None
 
 # --- Descarga ---
-def download_video_with_yt_dlp(mpd_url, output_path, series_url_for_referer):
+def download_span_fields(ok, mpd_url, output_path, *args):
+    return {"bytes": os.path.getsize(output_path) if ok and os.path.exists(output_path) else 0, "output": output_path}
+
+async def download_video_with_yt_dlp_async(mpd_url, output_path, series_url_for_referer):
     if not mpd_url: print("No MPD URL."); return False
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     print(f"Descargando: {mpd_url}\n  a: {output_path}")
+    with span("download_ytdlp") as record:
+        try:
+            await SCHEDULER.call_async(host_of(mpd_url), lambda: run_yt_dlp(mpd_url, output_path, series_url_for_referer),
+                                       attempts=YTDLP_ATTEMPTS, label="yt-dlp")
+            print(f"Descarga completa: {output_path}\n"); ok = True
+        except YtDlpError as e: print(f"Error yt-dlp (code {e.returncode}):\n{e.stderr[:500]}"); ok = False
+        except Exception as e: print(f"Excepción yt-dlp: {e}"); ok = False
+        record["ok"] = ok
+        record.update(download_span_fields(ok, mpd_url, output_path))
+        return ok
+
+def download_video_with_yt_dlp(mpd_url, output_path, series_url_for_referer):
+    # Para llamadas síncronas fuera del orquestador (respaldo del motor nativo en un hilo, bench.py).
+    return asyncio.run(download_video_with_yt_dlp_async(mpd_url, output_path, series_url_for_referer))
+
+class YtDlpError(Exception):
+    def __init__(self, returncode, stderr):
+        super().__init__(f"yt-dlp terminó con código {returncode}")
+        self.returncode, self.stderr = returncode, stderr
+        status_match = re.search(r"HTTP Error (\d{3})", stderr)
+        self.status = int(status_match.group(1)) if status_match else None # Para classify_error
+
+YTDLP_PROGRESS_REGEX = re.compile(r"\[download\]\s+(\d+(?:\.\d+)?)%(?:\s+of\s+~?\s*(\S+))?(?:\s+at\s+(\S+))?(?:\s+ETA\s+(\S+))?")
+PROGRESS_REPORT_SECONDS = 5 # Cada cuánto se imprime el progreso de una descarga
+
+async def terminate_process(process, grace=5):
+    if process.returncode is not None: return
+    process.terminate()
+    try: await asyncio.wait_for(process.wait(), grace)
+    except asyncio.TimeoutError: process.kill(); await process.wait()
+
+async def run_yt_dlp(mpd_url, output_path, series_url_for_referer):
+    # Subproceso asyncio; con --newline cada actualización de progreso es una línea que se lee en vivo.
+    command = ['yt-dlp', mpd_url, '-o', output_path, '--allow-unplayable-formats', 
+               '--quiet', '--progress', '--newline', '--referer', series_url_for_referer]
+    process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    label = os.path.basename(output_path)
+    tail = collections.deque(maxlen=40) # Últimas líneas que no son de progreso, para el mensaje de error
+    last_report = {"at": 0.0}
+    async def pump(stream):
+        async for raw_line in stream:
+            line = raw_line.decode(errors='ignore').strip()
+            match = YTDLP_PROGRESS_REGEX.search(line)
+            if not match:
+                if line: tail.append(line)
+                continue
+            now = time.monotonic()
+            if now - last_report["at"] >= PROGRESS_REPORT_SECONDS:
+                last_report["at"] = now
+                percent, size, speed, eta = match.groups()
+                print(f"  [{label}] {percent}%" + (f" de {size}" if size else "") + (f" a {speed}" if speed else "") + (f", quedan {eta}" if eta else ""))
+    try:
+        await asyncio.gather(pump(process.stdout), pump(process.stderr))
+        returncode = await process.wait()
+    except BaseException: # Cancelación (Ctrl-C) o error: no dejar yt-dlp huérfano
+        await terminate_process(process)
+        raise
+    if returncode != 0: raise YtDlpError(returncode, "\n".join(tail))
+
+# --- Motor DASH nativo ---
+# Descarga en proceso: parsea el MPD, elige la mejor representación de vídeo y de audio,
+# baja sus segmentos en paralelo (HTTP/2 con httpx si está instalado), los escribe en orden
+# y une las pistas con ffmpeg. Ante cualquier DashError se recurre a yt-dlp.
+class DashError(Exception):
+    pass
+
+class DownloadInterrupted(Exception):
+    # Parada pedida por el usuario: el progreso queda guardado en el diario y no se usa yt-dlp.
+    pass
+
+# Diario de checkpoints por fichero: <salida>.journal.json con el MPD, las representaciones
+# elegidas y, para cada una, cuántos segmentos (y bytes) están ya escritos en su .part.
+def journal_path(output_path):
+    return f"{output_path}.journal.json"
+
+def load_download_journal(output_path):
+    try:
+        with open(journal_path(output_path), encoding="utf-8") as f: return json.load(f)
+    except FileNotFoundError: return None
+    except ValueError as e: print(f"Diario de '{output_path}' ilegible ({e}). Se ignora."); return None
+
+def save_download_journal(output_path, journal):
+    journal["updated_at"] = time.time()
+    tmp_path = f"{journal_path(output_path)}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f: json.dump(journal, f, indent=2)
+    os.replace(tmp_path, journal_path(output_path))
+
+def delete_download_journal(output_path):
+    try: os.remove(journal_path(output_path))
+    except FileNotFoundError: pass
+
+def discard_native_download(output_path):
+    # Otro motor ha terminado el episodio: los .part y el diario del motor nativo sobran (y reanudarían encima).
+    for suffix in (".video.part", ".audio.part", ".remux.part"):
+        with contextlib.suppress(FileNotFoundError): os.remove(f"{output_path}{suffix}")
+    delete_download_journal(output_path)
+
+def journal_matches(journal, selected):
+    # Solo se reanuda si el MPD nuevo ofrece exactamente las mismas pistas y el mismo número de segmentos.
+    saved = journal.get("representations", [])
+    return len(saved) == len(selected) and all(
+        s.get("id") == r["id"] and s.get("content_type") == r["content_type"] and
+        s.get("total") == len(r["segments"]) + (1 if r["init"] else 0)
+        for s, r in zip(saved, selected))
+
+_segment_client = None
+_segment_client_lock = threading.Lock()
+
+def get_segment_client():
+    global _segment_client
+    with _segment_client_lock:
+        if _segment_client is None:
+            if httpx is not None:
+                limits = httpx.Limits(max_connections=DASH_SEGMENT_WORKERS * MAX_PARALLEL_DOWNLOADS)
+                _segment_client = httpx.Client(http2=True, limits=limits, follow_redirects=True, headers={"User-Agent": USER_AGENT})
+            else: _segment_client = get_http_session()
+        return _segment_client
+
+def fetch_bytes(url, headers=None):
+    def fetch():
+        resp = get_segment_client().get(url, headers=headers or {}, timeout=HTTP_TIMEOUT)
+        resp.raise_for_status()
+        return resp.content
+    return SCHEDULER.call(host_of(url), fetch, attempts=DASH_SEGMENT_RETRIES, label="segmento")
+
+def parse_iso_duration(value):
+    # Años y meses casi siempre llegan a cero ("P0Y0M0DT0H45M12.000S"); si no, se aproximan a 365 y 30 días.
+    match = re.fullmatch(r"P(?:([\d.]+)Y)?(?:([\d.]+)M)?(?:([\d.]+)D)?(?:T(?:([\d.]+)H)?(?:([\d.]+)M)?(?:([\d.]+)S)?)?", (value or "").strip())
+    if not match: return None
+    years, months, days, hours, minutes, seconds = (float(g) if g else 0.0 for g in match.groups())
+    return (years * 365 + months * 30 + days) * 86400 + hours * 3600 + minutes * 60 + seconds
+
+def expand_segment_template(template, rep_id, bandwidth, number=None, start_time=None):
+    values = {"RepresentationID": rep_id, "Number": number, "Time": start_time, "Bandwidth": bandwidth}
+    def replace(match):
+        name, fmt = match.group(1), match.group(2)
+        if not name: return "$"
+        return fmt % int(values[name]) if fmt else str(values[name])
+    return re.sub(r"\$(RepresentationID|Number|Time|Bandwidth|)(%0\d+d)?\$", replace, template)
+
+def resolve_base_url(base_url, element):
+    base_el = element.find("{*}BaseURL")
+    return urljoin(base_url, base_el.text.strip()) if base_el is not None and base_el.text else base_url
+
+def build_segment_urls(as_el, rep_el, base_url, period_duration):
+    # Devuelve (url_de_inicialización, [urls_de_segmentos]) según SegmentTemplate, SegmentList o un único BaseURL.
+    rep_id, bandwidth = rep_el.get("id", ""), rep_el.get("bandwidth", "0")
+    template_attrs, timeline = {}, None
+    for el in (as_el, rep_el): # La plantilla de la representación hereda y sobrescribe la del AdaptationSet
+        template = el.find("{*}SegmentTemplate")
+        if template is None: continue
+        template_attrs.update(template.attrib)
+        if template.find("{*}SegmentTimeline") is not None: timeline = template.find("{*}SegmentTimeline")
+    if template_attrs:
+        media = template_attrs.get("media")
+        if not media: raise DashError("SegmentTemplate sin atributo media.")
+        timescale = int(template_attrs.get("timescale", 1))
+        start_number = int(template_attrs.get("startNumber", 1))
+        urls = []
+        if timeline is not None:
+            number, start = start_number, 0
+            for s_el in timeline.findall("{*}S"):
+                start, duration, repeat = int(s_el.get("t", start)), int(s_el.get("d")), int(s_el.get("r", 0))
+                if repeat < 0: # Repetir hasta el final del periodo
+                    if not period_duration: raise DashError("SegmentTimeline abierto sin duración de periodo.")
+                    repeat = math.ceil((period_duration * timescale - start) / duration) - 1
+                for _ in range(repeat + 1):
+                    urls.append(urljoin(base_url, expand_segment_template(media, rep_id, bandwidth, number, start)))
+                    start += duration; number += 1
+        else:
+            if not template_attrs.get("duration") or not period_duration: raise DashError("SegmentTemplate sin duración.")
+            segment_ticks = int(template_attrs["duration"])
+            count = math.ceil(period_duration / (segment_ticks / timescale))
+            urls = [urljoin(base_url, expand_segment_template(media, rep_id, bandwidth, start_number + i, i * segment_ticks)) for i in range(count)]
+        init = template_attrs.get("initialization")
+        return (urljoin(base_url, expand_segment_template(init, rep_id, bandwidth)) if init else None), urls
+
+    segment_list = rep_el.find("{*}SegmentList")
+    if segment_list is None: segment_list = as_el.find("{*}SegmentList")
+    if segment_list is not None:
+        if any(s.get("mediaRange") for s in segment_list.findall("{*}SegmentURL")): raise DashError("SegmentList con rangos de bytes no soportado.")
+        init_el = segment_list.find("{*}Initialization")
+        init_url = urljoin(base_url, init_el.get("sourceURL")) if init_el is not None and init_el.get("sourceURL") else None
+        return init_url, [urljoin(base_url, s.get("media")) for s in segment_list.findall("{*}SegmentURL")]
+    return None, [base_url] # SegmentBase o fichero único: se descarga entero
+
+def parse_mpd(mpd_text, mpd_url):
+    """
+    Convierte un MPD estático de un solo periodo en un dict con la duración y la lista de
+    representaciones (tipo, ancho de banda, altura, idioma, URL de inicialización y segmentos).
+    """
+    try: root = ET.fromstring(mpd_text)
+    except ET.ParseError as e: raise DashError(f"MPD mal formado: {e}")
+    if root.get("type", "static") != "static": raise DashError("MPD dinámico (directo) no soportado.")
+    periods = root.findall("{*}Period")
+    if len(periods) != 1: raise DashError(f"MPD con {len(periods)} periodos no soportado.")
+    period = periods[0]
+    duration = parse_iso_duration(period.get("duration")) or parse_iso_duration(root.get("mediaPresentationDuration"))
+    period_base = resolve_base_url(resolve_base_url(mpd_url, root), period)
+    representations = []
+    for as_el in period.findall("{*}AdaptationSet"):
+        as_base = resolve_base_url(period_base, as_el)
+        for rep_el in as_el.findall("{*}Representation"):
+            mime = rep_el.get("mimeType") or as_el.get("mimeType") or ""
+            content_type = as_el.get("contentType") or mime.split("/")[0]
+            if content_type not in ("video", "audio"): continue
+            init_url, segment_urls = build_segment_urls(as_el, rep_el, resolve_base_url(as_base, rep_el), duration)
+            representations.append({
+                "id": rep_el.get("id", ""), "content_type": content_type, "bandwidth": int(rep_el.get("bandwidth", 0)),
+                "height": int(rep_el.get("height") or as_el.get("height") or 0), "lang": as_el.get("lang") or "",
+                "init": init_url, "segments": segment_urls,
+            })
+    if not representations: raise DashError("El MPD no contiene pistas de vídeo ni de audio.")
+    return {"duration": duration, "representations": representations}
+
+def select_representations(manifest):
+    reps = manifest["representations"]
+    videos = [r for r in reps if r["content_type"] == "video" and (not DASH_MAX_HEIGHT or r["height"] <= DASH_MAX_HEIGHT)]
+    videos = videos or [r for r in reps if r["content_type"] == "video"]
+    audios = [r for r in reps if r["content_type"] == "audio"]
+    def audio_rank(rep):
+        lang = rep["lang"].lower()
+        lang_rank = next((i for i, pref in enumerate(DASH_AUDIO_LANGS) if lang == pref.lower()), len(DASH_AUDIO_LANGS))
+        return (-lang_rank, rep["bandwidth"])
+    selected = []
+    if videos: selected.append(max(videos, key=lambda r: (r["height"], r["bandwidth"])))
+    if audios: selected.append(max(audios, key=audio_rank))
+    return selected
+
+def download_representation(rep, part_path, headers, state=None, checkpoint=None):
+    """
+    Descarga los segmentos de una representación en `part_path`, siempre en orden, con una ventana
+    deslizante de como mucho 2*DASH_SEGMENT_WORKERS segmentos en vuelo. `state` ({"done", "bytes"})
+    permite reanudar: se trunca el .part a los bytes confirmados y se sigue desde el segmento `done`.
+    `checkpoint()` se llama periódicamente y al salir (también con error o Ctrl-C).
+    """
+    urls = ([rep["init"]] if rep["init"] else []) + rep["segments"]
+    total = len(urls)
+    state = state if state is not None else {}
+    if state.get("done") and os.path.exists(part_path) and os.path.getsize(part_path) >= state.get("bytes", 0):
+        print(f"  [{rep['content_type']} {rep['id']}] Reanudando: {state['done']}/{total} segmentos ya descargados.")
+    else: state["done"], state["bytes"] = 0, 0
+    if state["done"] >= total: return state["bytes"]
+    next_idx = state["done"]
+    last_report, last_checkpoint = state["done"] * 10 // total, time.monotonic()
+    pending = collections.deque()
+    with open(part_path, "r+b" if state["done"] else "wb") as out, ThreadPoolExecutor(max_workers=DASH_SEGMENT_WORKERS) as pool:
+        out.truncate(state["bytes"]); out.seek(state["bytes"]) # Descarta lo escrito después del último checkpoint
+        try:
+            while next_idx < total or pending:
+                if DOWNLOAD_SHUTDOWN.is_set(): raise DownloadInterrupted(f"{state['done']}/{total} segmentos guardados")
+                while next_idx < total and len(pending) < DASH_SEGMENT_WORKERS * 2:
+                    pending.append(pool.submit(fetch_bytes, urls[next_idx], headers)); next_idx += 1
+                data = pending.popleft().result()
+                out.write(data)
+                state["bytes"] += len(data); state["done"] += 1
+                if checkpoint and time.monotonic() - last_checkpoint >= DASH_CHECKPOINT_SECONDS:
+                    out.flush(); checkpoint(); last_checkpoint = time.monotonic()
+                if state["done"] * 10 // total > last_report:
+                    last_report = state["done"] * 10 // total
+                    print(f"  [{rep['content_type']} {rep['id']}] {state['done']}/{total} segmentos ({state['bytes'] / 1e6:.1f} MB)")
+        except BaseException:
+            for future in pending: future.cancel()
+            raise
+        finally:
+            out.flush()
+            if checkpoint: checkpoint()
+    return state["bytes"]
+
+def remux_streams(part_paths, output_path):
+    if len(part_paths) == 1 and shutil.which("ffmpeg") is None:
+        os.replace(part_paths[0], output_path); return
+    if shutil.which("ffmpeg") is None: raise DashError("ffmpeg no está instalado (necesario para unir vídeo y audio).")
+    tmp_output = f"{output_path}.remux.part"
+    command = ["ffmpeg", "-y", "-loglevel", "error"]
+    for part in part_paths: command += ["-i", part]
+    for i in range(len(part_paths)): command += ["-map", str(i)]
+    command += ["-c", "copy", "-f", "mp4", tmp_output]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise DashError(f"ffmpeg falló (code {result.returncode}): {result.stderr.decode(errors='ignore')[:300]}")
+    os.replace(tmp_output, output_path)
+    for part in part_paths: os.remove(part)
+
+@timed_phase("download_dash", result_fields=download_span_fields)
+def download_dash_native(mpd_url, output_path, series_url_for_referer):
+    if os.path.exists(output_path) and not os.path.exists(journal_path(output_path)): # Como yt-dlp: lo terminado no se repite
+        print(f"Ya descargado: {output_path}"); return True
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    print(f"Descargando (DASH nativo): {mpd_url}\n  a: {output_path}")
+    headers = {"Referer": series_url_for_referer} if series_url_for_referer else {}
+    manifest = parse_mpd(fetch_bytes(mpd_url, headers).decode("utf-8", errors="replace"), mpd_url)
+    remember_mpd_duration(mpd_url, manifest["duration"]) # Para verify_and_index, cuando el MPD ya haya caducado
+    selected = select_representations(manifest)
+    if len(selected) > 1 and shutil.which("ffmpeg") is None: # Antes de bajar nada: sin ffmpeg no se pueden unir las pistas
+        raise DashError("ffmpeg no está instalado (necesario para unir vídeo y audio).")
+    journal = load_download_journal(output_path)
+    if journal and not journal_matches(journal, selected):
+        print("  El checkpoint guardado no coincide con el MPD actual. Se empieza de cero.")
+        journal = None
+    if journal is None:
+        journal = {"output_path": output_path, "representations": [
+            {"id": r["id"], "content_type": r["content_type"], "total": len(r["segments"]) + (1 if r["init"] else 0), "done": 0, "bytes": 0}
+            for r in selected]}
+    journal["mpd_url"] = mpd_url # El último MPD válido, para reanudar sin volver a abrir el navegador
+    save_download_journal(output_path, journal)
+
+    part_paths = []
+    for rep, rep_state in zip(selected, journal["representations"]):
+        part_path = f"{output_path}.{rep['content_type']}.part"
+        download_representation(rep, part_path, headers, rep_state, checkpoint=lambda: save_download_journal(output_path, journal))
+        part_paths.append(part_path)
+    remux_streams(part_paths, output_path)
+    delete_download_journal(output_path)
+    print(f"Descarga completa: {output_path}\n")
+    return True
+
+# --- Estado de descargas por serie (sincronización incremental) ---
+# OUTPUT_BASE_DIR/<serie>/.estado.json guarda, por "temporada|título", el MPD, la ruta,
+# el tamaño y el SHA-256 de cada episodio descargado.
+_series_state_lock = threading.Lock()
+
+def series_state_path(series_slug):
+    return os.path.join(OUTPUT_BASE_DIR, sanitize_filename(series_slug), SERIES_STATE_FILENAME)
+
+def load_series_state(series_slug):
+    try:
+        with open(series_state_path(series_slug), encoding="utf-8") as f: return json.load(f)
+    except FileNotFoundError: return {"episodes": {}}
+    except ValueError as e:
+        print(f"Estado de '{series_slug}' ilegible ({e}). Se empieza de cero.")
+        return {"episodes": {}}
+
+def save_series_state(series_slug, state):
+    path = series_state_path(series_slug)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f: json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path) # Escritura atómica
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""): digest.update(chunk)
+    return digest.hexdigest()
+
+def record_episode_download(series_slug, season_text, ep_title, mpd_url, output_path, sha256=None):
+    entry = {
+        "season": season_text, "title": ep_title, "mpd_url": mpd_url, "output_path": output_path,
+        "size": os.path.getsize(output_path), "sha256": sha256 or file_sha256(output_path), "downloaded_at": time.time(),
+    }
+    with _series_state_lock:
+        state = load_series_state(series_slug)
+        state.setdefault("episodes", {})[catalog_key(season_text, ep_title)] = entry
+        save_series_state(series_slug, state)
+    return entry
+
+def is_episode_complete(state, series_slug, season_text, ep_title):
+    output_path = episode_output_path(series_slug, season_text, ep_title)
+    # Con diario, el motor nativo tiene una descarga a medias; yt-dlp no crea output_path hasta terminar
+    if not os.path.exists(output_path) or os.path.exists(journal_path(output_path)): return False
+    entry = state.get("episodes", {}).get(catalog_key(season_text, ep_title))
+    if entry is None: # Descargado antes de existir el estado: se adopta tal cual
+        return os.path.getsize(output_path) > 0
+    return os.path.getsize(output_path) == entry.get("size")
+
+# --- Verificación e índice de contenido (deduplicación) ---
+# content_index (en la base de datos del catálogo) relaciona cada fichero descargado con el asset del MPD,
+# su SHA-256 y su duración. Un mismo episodio publicado con otro título o en otra temporada se enlaza
+# (hardlink) en lugar de descargarse otra vez, y un fichero más corto de lo que dice el MPD se aparta
+# como "<fichero>.truncado" para que se vuelva a descargar.
+ASSET_ID_REGEX = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|\d{6,}", re.IGNORECASE)
+
+def mpd_asset_id(mpd_url):
+    # Los tokens del query y el host del CDN cambian entre peticiones; el identificador del vídeo en la ruta no.
+    # Sin identificador reconocible, None: una ruta genérica ("/manifest.mpd") no identifica nada.
+    ids = ASSET_ID_REGEX.findall(urlparse(mpd_url).path)
+    return ids[-1].lower() if ids else None
+
+def probe_duration(path):
+    # Duración del contenedor según ffprobe; None si no hay ffprobe o el fichero no se puede leer.
+    if shutil.which("ffprobe") is None: return None
+    result = subprocess.run(["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=nw=1:nk=1", path],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try: return float(result.stdout.decode().strip()) if result.returncode == 0 else 0.0
+    except ValueError: return 0.0 # Contenedor ilegible: tan malo como truncado
+
+# Duración de cada MPD leída antes de descargar: tras una descarga larga el token de la URL suele haber caducado
+_mpd_durations = {}
+_mpd_durations_lock = threading.Lock()
+
+def remember_mpd_duration(mpd_url, duration):
+    with _mpd_durations_lock: _mpd_durations[mpd_url] = duration
+
+def mpd_expected_duration(mpd_url, referer=None):
+    with _mpd_durations_lock:
+        if mpd_url in _mpd_durations: return _mpd_durations[mpd_url]
+    headers = {"Referer": referer} if referer else {}
+    try: duration = parse_mpd(fetch_bytes(mpd_url, headers).decode("utf-8", errors="replace"), mpd_url)["duration"]
+    except (DashError,) + HTTP_ERRORS as e: print(f"  No se pudo leer la duración del MPD: {e}"); return None
+    remember_mpd_duration(mpd_url, duration)
+    return duration
+
+@functools.lru_cache(maxsize=None)
+def warn_once(message):
+    print(message)
+
+def duration_tolerance(expected_duration):
+    return max(VERIFY_DURATION_TOLERANCE, expected_duration * VERIFY_DURATION_TOLERANCE_PCT / 100)
+
+def is_truncated(duration, expected_duration):
+    if duration is None or not expected_duration: return False # Sin ffprobe o sin duración en el MPD: no se puede saber
+    return duration < expected_duration - duration_tolerance(expected_duration)
+
+def content_index_put(path, asset_id, sha256, duration=None, expected_duration=None, mpd_url=None):
+    with _catalog_lock:
+        conn = get_catalog()
+        conn.execute("""INSERT OR REPLACE INTO content_index (path, asset_id, sha256, size, duration, expected_duration, mpd_url, indexed_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                     (os.path.abspath(path), asset_id, sha256, os.path.getsize(path), duration, expected_duration, mpd_url, time.time()))
+        conn.commit()
+
+def content_index_alias(source, path):
+    # Otra ruta para un fichero ya indexado (hardlink): mismos hash y duraciones, sin volver a leerlo. Devuelve el sha256.
+    with _catalog_lock:
+        conn = get_catalog()
+        conn.execute("""INSERT OR REPLACE INTO content_index (path, asset_id, sha256, size, duration, expected_duration, mpd_url, indexed_at)
+                        SELECT ?, asset_id, sha256, size, duration, expected_duration, mpd_url, ? FROM content_index WHERE path=?""",
+                     (os.path.abspath(path), time.time(), os.path.abspath(source)))
+        conn.commit()
+        row = conn.execute("SELECT sha256 FROM content_index WHERE path=?", (os.path.abspath(path),)).fetchone()
+    return row[0] if row else None
+
+def content_index_drop(path):
+    with _catalog_lock:
+        conn = get_catalog()
+        conn.execute("DELETE FROM content_index WHERE path=?", (os.path.abspath(path),))
+        conn.commit()
+
+def content_index_duration(path):
+    # Duración esperada (la del MPD) del fichero indexado o, si no se guardó, la medida con ffprobe.
+    with _catalog_lock:
+        row = get_catalog().execute("SELECT expected_duration, duration FROM content_index WHERE path=?", (os.path.abspath(path),)).fetchone()
+    return (row[0] or row[1]) if row else None
+
+def content_index_find(asset_id=None, sha256=None, exclude_path=None):
+    # Primer fichero indexado con ese asset o hash que sigue existiendo con el mismo tamaño; las filas obsoletas se borran.
+    column, value = ("asset_id", asset_id) if asset_id else ("sha256", sha256)
+    with _catalog_lock:
+        rows = get_catalog().execute(f"SELECT path, size FROM content_index WHERE {column}=?", (value,)).fetchall()
+    exclude = os.path.abspath(exclude_path) if exclude_path else None
+    for path, size in rows:
+        if path == exclude: continue
+        if os.path.exists(path) and os.path.getsize(path) == size: return path
+        content_index_drop(path)
+    return None
+
+def link_or_copy(source, target):
+    # Ya son el mismo fichero: os.replace entre dos enlaces al mismo inodo no hace nada y dejaría el .part
+    if os.path.exists(target) and os.path.samefile(source, target): return
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_target = f"{target}.enlace.part"
+    if os.path.exists(tmp_target): os.remove(tmp_target)
+    try: os.link(source, tmp_target)
+    except OSError: shutil.copy2(source, tmp_target) # Otro sistema de ficheros o sin soporte de hardlinks
+    os.replace(tmp_target, target)
+
+def link_existing_asset(mpd_url, output_path, referer=None):
+    # Antes de descargar: si el asset ya está en OUTPUT_BASE_DIR con otro nombre (y dura lo mismo), se enlaza.
+    asset_id = mpd_asset_id(mpd_url)
+    existing = content_index_find(asset_id=asset_id, exclude_path=output_path) if asset_id else None
+    if existing is None: return False
+    # El identificador sale de la ruta y puede coincidir por casualidad (fechas, números de bucket): se confirma con la duración
+    indexed, expected = content_index_duration(existing), mpd_expected_duration(mpd_url, referer)
+    if not indexed or not expected or abs(indexed - expected) > duration_tolerance(expected):
+        print(f"  '{existing}' comparte identificador con el MPD pero no su duración. Se descarga."); return False
+    print(f"  El vídeo ya está descargado en '{existing}'. Se enlaza en lugar de descargarlo.")
+    link_or_copy(existing, output_path)
+    return True
+
+def verify_and_index(mpd_url, output_path, referer=None):
+    # Tras una descarga correcta: comprobación rápida de integridad e indexado. Devuelve (ok, sha256).
+    asset_id = mpd_asset_id(mpd_url)
+    existing = content_index_find(asset_id=asset_id, exclude_path=output_path) if asset_id else None
+    if existing and os.path.samefile(existing, output_path): return True, content_index_alias(existing, output_path) # Enlazado: ya verificado
+    expected = mpd_expected_duration(mpd_url, referer)
+    duration = probe_duration(output_path)
+    if duration is None: warn_once("  AVISO: ffprobe no está instalado; no se comprueba si las descargas están truncadas.")
+    elif not expected: print(f"  AVISO: sin duración del MPD; no se comprueba si '{output_path}' está truncado.")
+    if is_truncated(duration, expected):
+        print(f"  '{output_path}' dura {duration:.0f}s y el MPD dice {expected:.0f}s. Se aparta como truncado para volver a descargarlo.")
+        os.replace(output_path, f"{output_path}.truncado")
+        delete_download_journal(output_path)
+        return False, None
+    sha256 = file_sha256(output_path)
+    duplicate = content_index_find(sha256=sha256, exclude_path=output_path)
+    if duplicate: # Mismo contenido con otro asset: se comparte el fichero en disco
+        print(f"  '{output_path}' es idéntico a '{duplicate}'. Se sustituye por un enlace.")
+        link_or_copy(duplicate, output_path)
+    content_index_put(output_path, asset_id, sha256, duration, expected, mpd_url)
+    return True, sha256
+
+def verify_content_index():
+    # --verificar: vuelve a comprobar todo lo indexado y aparta lo que esté truncado o haya desaparecido.
+    with _catalog_lock: rows = get_catalog().execute("SELECT path, size, expected_duration FROM content_index").fetchall()
+    print(f"\n--- Verificando {len(rows)} ficheros indexados ---")
+    flagged = 0
+    for path, size, expected in rows:
+        if not os.path.exists(path) or os.path.getsize(path) != size:
+            print(f"  Desaparecido o modificado: {path}"); content_index_drop(path); flagged += 1; continue
+        duration = probe_duration(path)
+        if duration is None: warn_once("  AVISO: ffprobe no está instalado; solo se comprueba que los ficheros existen y no han cambiado.")
+        if is_truncated(duration, expected):
+            print(f"  Truncado ({duration:.0f}s de {expected:.0f}s): {path}")
+            os.replace(path, f"{path}.truncado"); content_index_drop(path); flagged += 1
+    print(f"--- Verificación terminada: {flagged} ficheros a volver a descargar ---")
+    return flagged
+
+def episode_metrics_context(episode_meta):
+    return metrics_context(series=episode_meta.get("series_slug"), season=episode_meta.get("season_text"), episode=episode_meta.get("ep_title"))
+
+def record_download_result(ok, mpd_url, output_path, episode_meta, referer=None):
+    try: return _record_download_result(ok, mpd_url, output_path, episode_meta, referer)
+    finally:
+        with _mpd_durations_lock: _mpd_durations.pop(mpd_url, None) # Solo servía para verificar esta descarga
+
+def _record_download_result(ok, mpd_url, output_path, episode_meta, referer=None):
+    sha256 = None
+    if ok and os.path.exists(output_path):
+        try: ok, sha256 = verify_and_index(mpd_url, output_path, referer)
+        except OSError as e: print(f"No se pudo verificar '{output_path}': {e}")
+    if ok and episode_meta and os.path.exists(output_path):
+        try: record_episode_download(episode_meta["series_slug"], episode_meta["season_text"], episode_meta["ep_title"], mpd_url, output_path, sha256)
+        except OSError as e: print(f"No se pudo actualizar el estado de '{output_path}': {e}")
+    if not ok and episode_meta and not DOWNLOAD_SHUTDOWN.is_set(): # El MPD puede ser la causa: no se reutiliza
+        catalog_delete("mpd", catalog_key(episode_meta["series_slug"], episode_meta["season_text"], episode_meta["ep_title"]))
+    return ok
+
+# --- Orquestador asyncio ---
+# Un único bucle de eventos coordina tres etapas, cada una con su propio límite de concurrencia:
+#  - navegador: un hilo (el driver no es thread-safe) que abre temporadas y hace clic en tarjetas;
+#  - resolución rápida: RESOLVE_CONCURRENCY hilos que sacan MPDs del catálogo, del checkpoint o por HTTP;
+#  - descarga: MAX_PARALLEL_DOWNLOADS tareas que consumen una cola acotada (DOWNLOAD_QUEUE_SIZE, los MPD
+#    pueden caducar); yt-dlp corre como subproceso asyncio y el motor nativo en un hilo.
+# Ctrl-C cancela la tarea principal: se cancelan las descargas, se terminan los subprocesos y
+# DOWNLOAD_SHUTDOWN hace que los hilos paren en su siguiente punto de control.
+async def run_blocking(executor, fn, *args):
+    # Como asyncio.to_thread, pero en el executor de la etapa y conservando el contexto de métricas.
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(context.run, fn, *args))
+
+async def download_episode_async(mpd_url, output_path, series_url_for_referer, executor):
+    if not mpd_url: print("No MPD URL."); return False
     try:
-        command = ['yt-dlp', mpd_url, '-o', output_path, '--allow-unplayable-formats', 
-                   '--quiet', '--progress', '--referer', series_url_for_referer]
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, stderr = process.communicate()
-        if process.returncode == 0: print(f"Descarga completa: {output_path}\n"); return True
-        else: print(f"Error yt-dlp (code {process.returncode}):\n{stderr.decode(errors='ignore')[:500]}"); return False
-    except Exception as e: print(f"Excepción yt-dlp: {e}"); return False
+        if await run_blocking(executor, link_existing_asset, mpd_url, output_path, series_url_for_referer): return True
+    except OSError as e: print(f"  No se pudo reutilizar el fichero existente ({e}). Se descarga.")
+    if DOWNLOAD_BACKEND == "nativo":
+        try: return await run_blocking(executor, download_dash_native, mpd_url, output_path, series_url_for_referer)
+        except DownloadInterrupted as e: print(f"Descarga de '{output_path}' interrumpida ({e}). Se reanudará en la próxima ejecución."); return False
+        except (DashError, OSError) + HTTP_ERRORS as e: print(f"Motor DASH nativo falló ({e}). Usando yt-dlp...")
+    await run_blocking(executor, mpd_expected_duration, mpd_url, series_url_for_referer) # Mientras el MPD sigue vigente
+    ok = await download_video_with_yt_dlp_async(mpd_url, output_path, series_url_for_referer)
+    if ok: await run_blocking(executor, discard_native_download, output_path)
+    return ok
+
+class DownloadQueue:
+    """
+    Puente entre los productores (hilos del navegador) y la cola asyncio de descargas. `put` bloquea
+    el hilo mientras la cola está llena, igual que un queue.Queue acotado.
+    """
+    def __init__(self, orchestrator):
+        self.orchestrator = orchestrator
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max(1, orchestrator.queue_size))
+
+    def put(self, job):
+        if DOWNLOAD_SHUTDOWN.is_set(): raise DownloadInterrupted("parada pedida")
+        asyncio.run_coroutine_threadsafe(self.queue.put(job), self.loop).result()
+
+    def qsize(self):
+        return self.queue.qsize()
+
+    def enqueue_fast(self, season, episode_titles, queued_paths=None):
+        # Resuelve en paralelo lo que no necesita navegador y lo va encolando (bloqueando mientras la cola esté
+        # llena, igual que put); devuelve los títulos que necesitan el navegador.
+        return asyncio.run_coroutine_threadsafe(self.orchestrator.enqueue_fast(season, episode_titles, queued_paths), self.loop).result()
+
+class Orchestrator:
+    def __init__(self, num_downloads=MAX_PARALLEL_DOWNLOADS, queue_size=DOWNLOAD_QUEUE_SIZE, num_resolvers=RESOLVE_CONCURRENCY, on_result=None):
+        self.num_downloads = max(1, num_downloads)
+        self.on_result = on_result # on_result(output_path, ok, episode_meta), en un hilo, tras cada descarga
+        self.queue_size = queue_size
+        self.resolve_slots = max(1, num_resolvers)
+        self.browser_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="navegador")
+        self.resolve_executor = ThreadPoolExecutor(max_workers=self.resolve_slots, thread_name_prefix="resolucion")
+        self.download_executor = ThreadPoolExecutor(max_workers=self.num_downloads, thread_name_prefix="descarga")
+        self.results = {}
+
+    async def run(self, producer):
+        # producer(download_queue) es bloqueante y se ejecuta en el hilo del navegador.
+        self.download_queue = DownloadQueue(self)
+        self._resolve_semaphore = asyncio.Semaphore(self.resolve_slots)
+        self._queue_room = asyncio.Event() # Se activa cada vez que una descarga saca un elemento de la cola
+        workers = [asyncio.create_task(self._download_worker()) for _ in range(self.num_downloads)]
+        print(f"Orquestador: {self.num_downloads} descargas, {self.resolve_slots} resoluciones en paralelo (cola máx. {self.queue_size}).")
+        producer_error = None
+        try:
+            try: await run_blocking(self.browser_executor, producer, self.download_queue)
+            except Exception as e: # Un error del productor no invalida lo ya encolado: se descarga y después se relanza
+                print(f"Error resolviendo episodios ({e}). Se terminan las descargas ya encoladas.")
+                producer_error = e
+            await self.download_queue.queue.join()
+        except (asyncio.CancelledError, KeyboardInterrupt): # Ctrl-C: parar todo lo que esté en curso
+            DOWNLOAD_SHUTDOWN.set()
+            raise
+        finally:
+            for task in workers: task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        if producer_error: raise producer_error
+        return self.results
+
+    async def enqueue_fast(self, season, episode_titles, queued_paths=None):
+        # Cada MPD se encola en cuanto se resuelve, y una resolución solo empieza si su resultado cabe en la cola
+        # junto con las que ya están en marcha: las URLs caducan y no deben esperar fuera de la cola acotada.
+        download_queue = self.download_queue.queue
+        async def resolve(index, ep_title):
+            out_path = episode_output_path(season.series_slug, season.season_text, ep_title)
+            async with self._resolve_semaphore:
+                try: mpd_url = await run_blocking(self.resolve_executor, resolve_mpd_for_output, season, ep_title, out_path, False)
+                except Exception as e: print(f"  Resolución rápida de '{ep_title}' fallida: {e}"); mpd_url = None
+            return index, ep_title, out_path, mpd_url
+        titles = list(enumerate(episode_titles))
+        pending, browser_titles, found = set(), [], 0
+        room_waiter = None
+        try:
+            while titles or pending:
+                while titles and download_queue.qsize() + len(pending) < download_queue.maxsize and not DOWNLOAD_SHUTDOWN.is_set():
+                    pending.add(asyncio.create_task(resolve(*titles.pop(0))))
+                if DOWNLOAD_SHUTDOWN.is_set(): raise DownloadInterrupted("parada pedida")
+                waiters = set(pending)
+                if titles: # Cola llena: también despierta cuando una descarga saca un elemento
+                    self._queue_room.clear()
+                    room_waiter = asyncio.create_task(self._queue_room.wait()); waiters.add(room_waiter)
+                done, _ = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+                if room_waiter is not None: room_waiter.cancel(); room_waiter = None
+                for task in done & pending:
+                    pending.discard(task)
+                    index, ep_title, out_path, mpd_url = task.result()
+                    if not mpd_url: browser_titles.append((index, ep_title)); continue
+                    if queued_paths is not None: queued_paths.add(out_path)
+                    await self._feed(season, ep_title, out_path, mpd_url); found += 1 # Hay sitio: estaba contado en `pending`
+        finally:
+            if room_waiter is not None: room_waiter.cancel()
+            for task in pending: task.cancel()
+        if found: print(f"  {found}/{len(episode_titles)} MPDs resueltos sin navegador.")
+        return [ep_title for _, ep_title in sorted(browser_titles)]
+
+    async def _feed(self, season, ep_title, out_path, mpd_url):
+        if DOWNLOAD_SHUTDOWN.is_set(): raise DownloadInterrupted("parada pedida")
+        episode_meta = {"series_slug": season.series_slug, "season_text": season.season_text, "ep_title": ep_title}
+        await self.download_queue.queue.put((mpd_url, out_path, season.series_url, episode_meta))
+
+    async def _download_worker(self):
+        download_queue = self.download_queue.queue
+        while True:
+            mpd_url, output_path, referer, episode_meta = await download_queue.get()
+            self._queue_room.set()
+            try:
+                if DOWNLOAD_SHUTDOWN.is_set(): continue # Parada pedida: no empezar descargas nuevas
+                episode_meta = episode_meta or {}
+                with episode_metrics_context(episode_meta):
+                    ok = await download_episode_async(mpd_url, output_path, referer, self.download_executor)
+                    # El SHA-256 de un episodio entero no debe bloquear el bucle
+                    self.results[output_path] = await run_blocking(self.download_executor, record_download_result, ok, mpd_url, output_path, episode_meta, referer)
+                    if self.on_result: await run_blocking(self.download_executor, self.on_result, output_path, self.results[output_path], episode_meta)
+            except Exception as e: print(f"Error en la descarga de '{output_path}': {e}")
+            finally: download_queue.task_done()
+
+    def close(self, interrupted=False):
+        # Tras Ctrl-C los hilos de descarga paran solos en el siguiente segmento, tras guardar su checkpoint.
+        if interrupted: print("\nEsperando a que las descargas en curso guarden su checkpoint...")
+        self.browser_executor.shutdown(wait=not interrupted, cancel_futures=True)
+        self.resolve_executor.shutdown(wait=not interrupted, cancel_futures=True)
+        self.download_executor.shutdown(wait=True, cancel_futures=True)
+
+def run_pipeline(producer, num_downloads=MAX_PARALLEL_DOWNLOADS, on_result=None):
+    # Punto de entrada síncrono: un bucle de eventos para producer (en el hilo del navegador) y las descargas.
+    orchestrator = Orchestrator(num_downloads, on_result=on_result)
+    interrupted = False
+    try: return asyncio.run(orchestrator.run(producer))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        interrupted = True
+        raise
+    finally: orchestrator.close(interrupted)
+
+# --- Episodios de una temporada (catálogo + navegador bajo demanda) ---
+def get_season_folder(season_text):
+    season_folder_match = re.match(r"(Temporada\s*\d+)", season_text)
+    return sanitize_filename(season_folder_match.group(1) if season_folder_match else season_text.split('(')[0].strip())
+
+def episode_output_path(series_slug, season_text, ep_title):
+    return os.path.join(OUTPUT_BASE_DIR, sanitize_filename(series_slug), get_season_folder(season_text), f"{sanitize_filename(ep_title)}.mp4")
+
+class SeasonEpisodes:
+    """
+    Episodios y MPDs de una temporada. Consulta primero el catálogo en disco y solo abre la
+    temporada en el navegador (a través de `get_driver`) cuando hace falta hacer clic en una tarjeta.
+    """
+    def __init__(self, get_driver, series_slug, season_text, season_open=False, use_cache=True):
+        self.get_driver = get_driver
+        self.series_slug = series_slug
+        self.series_url = build_series_url_from_slug(series_slug)
+        self.season_text = season_text
+        self.season_open = season_open # True si la temporada ya está seleccionada en el navegador
+        self.use_cache = use_cache
+        self._cards = None
+        self._titles = catalog_get("episodes", self._key()) if use_cache else None
+
+    def _key(self, *extra):
+        return catalog_key(self.series_slug, self.season_text, *extra)
+
+    def load_from_browser(self):
+        driver = self.get_driver()
+        if not self.season_open:
+            if not select_season_interactive(driver, self.series_url, target_season=self.season_text):
+                self._cards = {}; return self._cards
+            self.season_open = True
+        elements = get_episode_elements_for_current_season(driver)
+        titles = get_episode_titles(elements, driver)
+        self._cards = dict(zip(titles, elements))
+        if titles:
+            self._titles = titles
+            catalog_put("episodes", self._key(), titles)
+        return self._cards
+
+    def titles(self):
+        if self._titles is None: self.load_from_browser()
+        return self._titles or []
+
+    def card(self, ep_title):
+        cards = self._cards if self._cards is not None else self.load_from_browser()
+        card = cards.get(ep_title)
+        if card is None and self.season_open: # Título escrito a mano: buscarlo directamente
+            ep_card_xpath = f"//div[{HAS_CLASS_XPATH.format('card--video')}][.//img[@aria-label='{ep_title}']]"
+            try: card = self.get_driver().find_element(By.XPATH, ep_card_xpath)
+            except NoSuchElementException: pass
+        return card
+
+    def resolve_mpd(self, ep_title, use_browser=True, use_fast=True):
+        # use_browser=False: solo catálogo y HTTP (seguro desde cualquier hilo); use_fast=False: directamente el navegador.
+        phase = "mpd_resolve" if use_browser else "mpd_resolve_fast"
+        with metrics_context(series=self.series_slug, season=self.season_text, episode=ep_title), span(phase) as record:
+            mpd_url = self._resolve_mpd(ep_title, record, use_browser, use_fast)
+            record["ok"] = mpd_url is not None
+            return mpd_url
+
+    def _resolve_mpd(self, ep_title, record, use_browser=True, use_fast=True):
+        key = self._key(ep_title)
+        mpd_url = None
+        if use_fast and self.use_cache:
+            mpd_url = catalog_get("mpd", key)
+            if mpd_url and is_mpd_reachable(mpd_url, self.series_url): # Como el diario: un MPD caducado no se reutiliza
+                print(f"  MPD de '{ep_title}' tomado del catálogo."); record["source"] = "catalog"; return mpd_url
+            if mpd_url: print(f"  MPD de '{ep_title}' del catálogo ya no responde. Se resuelve de nuevo."); catalog_delete("mpd", key); mpd_url = None
+        if use_fast and FAST_MPD_RESOLVER:
+            mpd_url = resolve_mpd_via_http(self.series_url, ep_title)
+            record["source"] = "http"
+        if not mpd_url and use_browser:
+            record["source"] = "browser"
+            card = self.card(ep_title)
+            if card is None: print(f"  No se encontró tarjeta para '{ep_title}'."); return None
+            attempt = {"n": 0}
+            def click_attempt():
+                record["retries"] = attempt["n"]; attempt["n"] += 1
+                print(f"  Intento MPD {attempt['n']}/{MAX_RETRIES_MPD + 1}...")
+                # Sin la ruta HTTP de click_episode_and_get_mpd si la etapa rápida ya lo intentó
+                url = click_episode_and_get_mpd(self.get_driver(), card, ep_title, self.series_url if use_fast else None)
+                if not url: raise TransientError("MPD no capturado")
+                return url
+            try: mpd_url = SCHEDULER.call(host_of(self.series_url), click_attempt, attempts=MAX_RETRIES_MPD + 1, label=f"MPD de '{ep_title}'")
+            except TransientError: mpd_url = None
+        if mpd_url: catalog_put("mpd", key, mpd_url)
+        return mpd_url
+
+def resolve_mpd_for_output(season, ep_title, out_path, use_browser=True, use_fast=True):
+    # Una descarga a medias se reanuda con el MPD de su diario si sigue siendo válido (sin navegador).
+    journal = load_download_journal(out_path) if use_fast else None
+    if journal and journal.get("mpd_url") and is_mpd_reachable(journal["mpd_url"], season.series_url):
+        print(f"  Reanudando '{ep_title}' con el MPD de su checkpoint.")
+        return journal["mpd_url"]
+    return season.resolve_mpd(ep_title, use_browser, use_fast)
+
+def download_episodes(season, episode_titles, download_queue, queued_paths=None):
+    # Resuelve los MPDs en orden y los va encolando; devuelve cuántos se encolaron.
+    # `queued_paths` evita encolar dos veces el mismo fichero (p.ej. al reintentar una tarea del pool).
+    # Con el orquestador, lo que se resuelve sin navegador se encola en paralelo y aquí solo queda el resto.
+    queued_paths = queued_paths if queued_paths is not None else set()
+    episode_titles = [t for t in episode_titles if episode_output_path(season.series_slug, season.season_text, t) not in queued_paths]
+    queued = 0
+    use_fast = not hasattr(download_queue, "enqueue_fast")
+    if not use_fast:
+        browser_titles = download_queue.enqueue_fast(season, episode_titles, queued_paths)
+        queued, episode_titles = len(episode_titles) - len(browser_titles), browser_titles
+    total_eps = len(episode_titles)
+    for i, ep_title in enumerate(episode_titles):
+        if DOWNLOAD_SHUTDOWN.is_set(): break
+        out_path = episode_output_path(season.series_slug, season.season_text, ep_title)
+        print(f"\n--- Procesando {i+1}/{total_eps}: '{ep_title}' ---")
+        mpd_url = resolve_mpd_for_output(season, ep_title, out_path, use_fast=use_fast)
+        if mpd_url:
+            queued_paths.add(out_path)
+            episode_meta = {"series_slug": season.series_slug, "season_text": season.season_text, "ep_title": ep_title}
+            download_queue.put((mpd_url, out_path, season.series_url, episode_meta)) # Bloquea si la cola está llena
+            queued += 1
+            print(f"  Encolado para descarga ({download_queue.qsize()} en cola).")
+        else: print(f"  No MPD para '{ep_title}'. Saltando.")
+        if i < total_eps - 1 and season.season_open: wait_for_dom_settled(season.get_driver(), "episode_gap") # El reproductor se ha asentado
+    return queued
+
+def sync_season(season, download_queue, queued_paths=None):
+    # Compara la lista de episodios en vivo con el estado guardado y solo descarga lo que falta.
+    print(f"\n--- Sincronizando {season.series_slug} / {season.season_text} ---")
+    season.load_from_browser() # Lista en vivo, no la del catálogo
+    live_titles = season.titles()
+    if not live_titles: print("  No hay episodios en la web."); return 0
+    state = load_series_state(season.series_slug)
+    missing = [t for t in live_titles if not is_episode_complete(state, season.series_slug, season.season_text, t)]
+    print(f"  {len(live_titles) - len(missing)} episodios al día, {len(missing)} por descargar.")
+    return download_episodes(season, missing, download_queue, queued_paths) if missing else 0
+
+def refresh_expired_catalog(get_driver):
+    # Revalida solo lo caducado; las entradas vigentes no se tocan.
+    print("\n--- Revalidando entradas caducadas del catálogo ---")
+    for key, mpd_url in catalog_expired_entries("mpd"):
+        if is_mpd_reachable(mpd_url, build_series_url_from_slug(key.split("|")[0])): catalog_put("mpd", key, mpd_url)
+        else: catalog_delete("mpd", key)
+    if catalog_expired_entries("series"): get_all_series_cached(get_driver, use_cache=False)
+    for series_slug, _ in catalog_expired_entries("seasons"):
+        list_seasons(get_driver(), build_series_url_from_slug(series_slug)) # Vuelve a guardar las opciones
+    for key, _ in catalog_expired_entries("episodes"):
+        series_slug, season_text = key.split("|", 1)
+        SeasonEpisodes(get_driver, series_slug, season_text, use_cache=False).load_from_browser()
+    catalog_evict()
+    print("--- Revalidación del catálogo terminada ---")
+
+# --- Modo por lotes (sin preguntas) ---
+# Formato del fichero de trabajos (JSON, o YAML si PyYAML está instalado):
+# [{"series": "slug", "seasons": ["Temporada 1", 2] | "all", "episodes": "all" | "1-5,8" | ["Episodio 3", 4],
+#   "mode": "download" | "sync"}]
+# Una temporada N (número) equivale a "Temporada N". En modo "sync" se ignora "episodes": se descarga
+# todo lo que falte según el estado de la serie.
+def normalize_job(job):
+    # Valida un trabajo y deja "seasons" como "all" o lista de textos de temporada; ValueError si no es válido.
+    if not isinstance(job, dict) or not job.get("series") or not isinstance(job["series"], str):
+        raise ValueError(f"Trabajo inválido (falta 'series'): {job}")
+    def is_item(value): return isinstance(value, (int, str)) and not isinstance(value, bool)
+    seasons = job.get("seasons", "all")
+    if seasons != "all":
+        seasons = seasons if isinstance(seasons, list) else [seasons]
+        if not seasons or not all(is_item(s) for s in seasons):
+            raise ValueError(f"'seasons' debe ser \"all\", una temporada o una lista de temporadas: {job}")
+        seasons = [f"Temporada {s}" if isinstance(s, int) or s.strip().isdigit() else s for s in seasons]
+    episodes = job.get("episodes", "all")
+    if not (is_item(episodes) or (isinstance(episodes, list) and episodes and all(is_item(e) for e in episodes))):
+        raise ValueError(f"'episodes' debe ser \"all\", un rango (\"1-5,8\"), un episodio o una lista: {job}")
+    if job.get("mode", "download") not in ("download", "sync"):
+        raise ValueError(f"'mode' debe ser \"download\" o \"sync\": {job}")
+    return dict(job, seasons=seasons, episodes=episodes)
+
+def load_job_file(path):
+    with open(path, encoding="utf-8") as f: raw = f.read()
+    if path.lower().endswith((".yaml", ".yml")):
+        if yaml is None: raise RuntimeError("Para ficheros YAML hace falta PyYAML (pip install pyyaml).")
+        jobs = yaml.safe_load(raw)
+    else: jobs = json.loads(raw)
+    if isinstance(jobs, dict): jobs = jobs.get("jobs", [])
+    if not isinstance(jobs, list): raise ValueError("El fichero de trabajos debe contener una lista.")
+    return [normalize_job(job) for job in jobs]
+
+def parse_episode_spec(spec):
+    # "1-5,8" -> [1, 2, 3, 4, 5, 8]; las listas pueden mezclar números y títulos.
+    if isinstance(spec, (int, str)): spec = [spec]
+    items = []
+    for part in spec:
+        if isinstance(part, int): items.append(part); continue
+        for piece in str(part).split(","):
+            piece = piece.strip()
+            range_match = re.fullmatch(r"(\d+)\s*-\s*(\d+)", piece)
+            if range_match: items.extend(range(int(range_match.group(1)), int(range_match.group(2)) + 1))
+            elif piece.isdigit(): items.append(int(piece))
+            elif piece: items.append(piece)
+    return items
+
+def select_episodes(episode_titles, spec):
+    # Un número N se interpreta como "Episodio N" si existe ese título; si no, como posición en la lista.
+    if spec in (None, "all"): return list(episode_titles)
+    selected = []
+    for item in parse_episode_spec(spec):
+        title = None
+        if isinstance(item, int):
+            prefixed = f"{EPISODE_NUMBER_PREFIX}{item}"
+            if prefixed in episode_titles: title = prefixed
+            elif 1 <= item <= len(episode_titles): title = episode_titles[item-1]
+        elif item in episode_titles: title = item
+        if title is None: print(f"  Episodio '{item}' no encontrado. Se ignora.")
+        elif title not in selected: selected.append(title)
+    return selected
+
+def get_job_seasons(job, get_driver, use_cache=True):
+    series_slug = job["series"]
+    seasons_spec = job.get("seasons", "all")
+    if seasons_spec != "all": return list(seasons_spec) # Ya normalizado por load_job_file
+    return (catalog_get("seasons", series_slug) if use_cache else None) or list_seasons(get_driver(), build_series_url_from_slug(series_slug))
+
+def process_job_season(job, season_text, get_driver, download_queue, queued_paths, use_cache=True):
+    print(f"\n  -- {job['series']} / {season_text} --")
+    season = SeasonEpisodes(get_driver, job["series"], season_text, use_cache=use_cache)
+    if job.get("mode") == "sync": return sync_season(season, download_queue, queued_paths)
+    episode_titles = select_episodes(season.titles(), job.get("episodes", "all"))
+    if not episode_titles: print(f"  Sin episodios para '{season_text}'. Saltando."); return 0
+    return download_episodes(season, episode_titles, download_queue, queued_paths)
+
+def run_batch(job_file, get_driver, use_cache=True, num_browsers=1):
+    jobs = load_job_file(job_file)
+    print(f"\n--- Modo por lotes: {len(jobs)} trabajos desde {job_file} ---")
+    queued_paths = set()
+    def produce(download_queue):
+        if num_browsers > 1:
+            # Tareas: (trabajo, None) se expande en una tarea por temporada, repartidas entre navegadores.
+            def handle_task(task, worker_get_driver, submit):
+                job, season_text = task
+                if season_text is None:
+                    for s_text in get_job_seasons(job, worker_get_driver, use_cache): submit((job, s_text))
+                else: process_job_season(job, season_text, worker_get_driver, download_queue, queued_paths, use_cache)
+            print(f"Usando {num_browsers} navegadores en paralelo.")
+            BrowserPool(num_browsers).run([(job, None) for job in jobs], handle_task)
+        else:
+            for job_idx, job in enumerate(jobs):
+                if DOWNLOAD_SHUTDOWN.is_set(): break
+                print(f"\n=== Trabajo {job_idx+1}/{len(jobs)}: {job['series']} ===")
+                try: # Como en el pool: el fallo de un trabajo no detiene los demás
+                    season_texts = get_job_seasons(job, get_driver, use_cache)
+                    if not season_texts: print(f"  Sin temporadas para '{job['series']}'. Saltando."); continue
+                    for season_text in season_texts:
+                        process_job_season(job, season_text, get_driver, download_queue, queued_paths, use_cache)
+                except DownloadInterrupted: raise
+                except Exception as e: print(f"  Error en el trabajo '{job['series']}': {e}. Se sigue con el siguiente.")
+    results = run_pipeline(produce)
+    ok = sum(1 for v in results.values() if v)
+    print(f"\nLote terminado: {ok}/{len(queued_paths)} descargas correctas.")
+    return ok == len(queued_paths)
+
+# --- Modo espejo: todo el catálogo con una cola de trabajo persistente ---
+# La tabla mirror_queue (en la base de datos del catálogo) guarda una fila por serie, temporada y episodio.
+# Las series se expanden en temporadas y las temporadas en episodios; el orden sale de MIRROR_PRIORITY_RULES
+# al consultar, así que cambiar las reglas entre ejecuciones no obliga a reconstruir la cola.
+# Lo que quedó a medias ("running") al cortarse una ejecución vuelve a "pending" en la siguiente.
+def season_number(season_text):
+    match = re.search(r"\d+", season_text or "")
+    return int(match.group(0)) if match else 0
+
+def season_recency(season_text):
+    # Clave de la regla "recientes": el año del texto ("Temporada 1 (2025)") pesa más que el número de temporada,
+    # así que una temporada con año va por delante de la temporada 14 de una serie antigua que no lo indica.
+    match = re.search(r"\b(?:19|20)\d{2}\b", season_text or "")
+    return (int(match.group(0)) * 1000 if match else 0) + season_number(season_text)
+
+def mirror_add(kind, series, season="", episodes=(), season_num=0, status="pending"):
+    # Con `episodes`, una fila por episodio (con su posición); si no, una fila de tipo serie o temporada.
+    now = time.time()
+    rows = [(kind, series, season, ep_title, season_num, position, len(episodes), status, now) for position, ep_title in enumerate(episodes)] \
+        if episodes else [(kind, series, season, "", season_num, 0, 0, status, now)]
+    with _catalog_lock:
+        conn = get_catalog()
+        conn.executemany("""INSERT OR IGNORE INTO mirror_queue (kind, series, season, episode, season_num, position, season_size, status, updated_at)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+        conn.commit()
+
+def mirror_set_status(kind, series, season="", episode="", status="done", error=None, size=None, count_attempt=False):
+    with _catalog_lock:
+        conn = get_catalog()
+        conn.execute("""UPDATE mirror_queue SET status=?, error=?, size=COALESCE(?, size), attempts=attempts+?, updated_at=?
+                        WHERE kind=? AND series=? AND season=? AND episode=?""",
+                     (status, error, size, 1 if count_attempt else 0, time.time(), kind, series, season, episode))
+        conn.commit()
+
+def mirror_fail(kind, series_slug, season_text, ep_title, error):
+    # Vuelve a la cola hasta agotar MIRROR_MAX_ATTEMPTS; después queda como fallido.
+    mirror_set_status(kind, series_slug, season_text, ep_title, "failed", error, count_attempt=True)
+    with _catalog_lock:
+        conn = get_catalog()
+        conn.execute("""UPDATE mirror_queue SET status='pending' WHERE kind=? AND series=? AND season=? AND episode=? AND attempts < ?""",
+                     (kind, series_slug, season_text, ep_title, MIRROR_MAX_ATTEMPTS))
+        conn.commit()
+
+def mirror_reset():
+    # Al empezar: lo interrumpido vuelve a la cola y series/temporadas (también las fallidas) se vuelven a expandir.
+    with _catalog_lock:
+        conn = get_catalog()
+        conn.execute("UPDATE mirror_queue SET status='pending' WHERE status='running' OR (kind IN ('series', 'season') AND status IN ('done', 'failed'))")
+        conn.commit()
+
+def mirror_order_clause(rules):
+    # Expansión antes que descargas; dentro de eso, las reglas en el orden dado.
+    terms = []
+    boosted = [rule.split(":", 1)[1] for rule in rules if rule.startswith("serie:")]
+    if boosted: terms.append(f"CASE WHEN series IN ({', '.join('?' * len(boosted))}) THEN 0 ELSE 1 END")
+    terms.append("CASE kind WHEN 'series' THEN 0 WHEN 'season' THEN 1 ELSE 2 END")
+    for rule in rules:
+        if rule == "recientes": terms.append("season_recency(season) DESC, position DESC")
+        elif rule == "pequenas": terms.append("season_size ASC")
+    terms.append("series, season_num, position")
+    return "ORDER BY " + ", ".join(terms), boosted
+
+def mirror_next_batch(rules, limit=MIRROR_BATCH_SIZE):
+    # Saca la fila más prioritaria y, si es un episodio, hasta `limit` episodios pendientes de su misma temporada.
+    order, params = mirror_order_clause(rules)
+    with _catalog_lock:
+        conn = get_catalog()
+        top = conn.execute(f"SELECT kind, series, season, episode FROM mirror_queue WHERE status='pending' {order} LIMIT 1", params).fetchone()
+        if top is None: return None, []
+        kind, series, season, episode = top
+        if kind == "episode":
+            rows = conn.execute(f"""SELECT episode FROM mirror_queue WHERE status='pending' AND kind='episode' AND series=? AND season=?
+                                    {order} LIMIT ?""", [series, season, *params, limit]).fetchall()
+            batch = [row[0] for row in rows]
+        else: batch = [episode]
+        conn.executemany("UPDATE mirror_queue SET status='running', updated_at=? WHERE kind=? AND series=? AND season=? AND episode=?",
+                         [(time.time(), kind, series, season, ep_title) for ep_title in batch])
+        conn.commit()
+    return (kind, series, season), batch
+
+def mirror_progress():
+    with _catalog_lock:
+        rows = get_catalog().execute("SELECT kind, status, COUNT(*), COALESCE(SUM(size), 0) FROM mirror_queue GROUP BY kind, status").fetchall()
+    return {(kind, status): (count, size) for kind, status, count, size in rows}
+
+def print_mirror_progress():
+    progress = mirror_progress()
+    episodes = {status: progress.get(("episode", status), (0, 0)) for status in ("done", "pending", "running", "failed")}
+    print(f"\n--- Espejo: {episodes['done'][0]} episodios descargados ({episodes['done'][1] / 1e9:.1f} GB), "
+          f"{episodes['pending'][0] + episodes['running'][0]} pendientes, {episodes['failed'][0]} fallidos ---")
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try: total += os.path.getsize(os.path.join(root, name))
+            except OSError: pass
+    return total
+
+def mirror_estimated_episode_size():
+    # Media de lo ya descargado; sin datos, MIRROR_ESTIMATED_EPISODE_BYTES.
+    count, size = mirror_progress().get(("episode", "done"), (0, 0))
+    return size // count if count and size else MIRROR_ESTIMATED_EPISODE_BYTES
+
+def mirror_episodes_that_fit(wanted, used_bytes, reserved_bytes, episode_bytes, quota_bytes=None, min_free_bytes=MIRROR_MIN_FREE_BYTES):
+    # Cuántos de `wanted` episodios caben contando lo reservado para los que ya están en cola y `episode_bytes` por episodio nuevo.
+    fit = wanted
+    if quota_bytes is not None:
+        fit = min(fit, max(0, int((quota_bytes - used_bytes - reserved_bytes) // episode_bytes)))
+        if fit < wanted: print(f"\nCuota casi alcanzada ({(used_bytes + reserved_bytes) / 1e9:.1f} de {quota_bytes / 1e9:.1f} GB, contando lo encolado).")
+    os.makedirs(OUTPUT_BASE_DIR, exist_ok=True)
+    free = shutil.disk_usage(OUTPUT_BASE_DIR).free - reserved_bytes
+    if min_free_bytes:
+        fit_free = max(0, int((free - min_free_bytes) // episode_bytes))
+        if fit_free < fit: print(f"\nQuedarían {free / 1e9:.1f} GB libres (mínimo {min_free_bytes / 1e9:.1f} GB)."); fit = fit_free
+    if fit < wanted: print(f"Se encolan {fit} de {wanted} episodios y no más.")
+    return fit
+
+def expand_mirror_item(kind, series_slug, season_text, get_driver, use_cache=True):
+    if kind == "series":
+        seasons = (catalog_get("seasons", series_slug) if use_cache else None) or list_seasons(get_driver(), build_series_url_from_slug(series_slug))
+        for s_text in seasons: mirror_add("season", series_slug, s_text, season_num=season_number(s_text))
+        print(f"  {series_slug}: {len(seasons)} temporadas.")
+        return bool(seasons)
+    titles = SeasonEpisodes(get_driver, series_slug, season_text, use_cache=use_cache).titles()
+    state = load_series_state(series_slug)
+    pending = [t for t in titles if not is_episode_complete(state, series_slug, season_text, t)]
+    done = [t for t in titles if t not in pending]
+    mirror_add("episode", series_slug, season_text, titles, season_number(season_text))
+    for ep_title in done: mirror_set_status("episode", series_slug, season_text, ep_title, "done")
+    with _catalog_lock: # Marcado como hecho pero el fichero ya no está (o está incompleto): otra vez a la cola
+        conn = get_catalog()
+        conn.executemany("UPDATE mirror_queue SET status='pending' WHERE kind='episode' AND series=? AND season=? AND episode=? AND status='done'",
+                         [(series_slug, season_text, ep_title) for ep_title in pending])
+        conn.commit()
+    print(f"  {series_slug} / {season_text}: {len(titles)} episodios, {len(pending)} por descargar.")
+    return bool(titles)
+
+def run_mirror(get_driver, use_cache=True, rules=None, quota_bytes=None, min_free_bytes=MIRROR_MIN_FREE_BYTES, num_browsers=1):
+    rules = MIRROR_PRIORITY_RULES if rules is None else rules
+    print(f"\n--- Modo espejo (prioridad: {', '.join(rules) or 'orden alfabético'}) ---")
+    mirror_reset()
+    for series_slug in get_all_series_cached(get_driver, use_cache).values(): mirror_add("series", series_slug)
+    # "reserved": lo estimado para los episodios encolados que aún no han terminado
+    disk = {"used": directory_size(OUTPUT_BASE_DIR) if quota_bytes is not None else 0, "reserved": 0, "per_episode": {}}
+    disk_lock = threading.Lock()
+
+    def on_result(output_path, ok, episode_meta):
+        key = ("episode", episode_meta["series_slug"], episode_meta["season_text"], episode_meta["ep_title"])
+        size = os.path.getsize(output_path) if ok and os.path.exists(output_path) else 0
+        with disk_lock:
+            disk["reserved"] -= disk["per_episode"].pop(output_path, 0)
+            disk["used"] += size
+        if ok: mirror_set_status(*key, "done", size=size, count_attempt=True)
+        elif DOWNLOAD_SHUTDOWN.is_set(): mirror_set_status(*key, "pending") # Interrumpida: no cuenta como intento
+        else: mirror_fail(*key, "descarga fallida")
+
+    opened = threading.local() # Temporada abierta en el navegador de cada hilo: se reutiliza mientras los lotes sean de ella
+
+    def process_next(worker_get_driver, download_queue):
+        # Saca y procesa la fila más prioritaria. Devuelve su tipo, None si no queda nada o "full" si no cabe más.
+        item, batch = mirror_next_batch(rules)
+        if item is None: return None
+        kind, series_slug, season_text = item
+        if kind != "episode":
+            try: ok = expand_mirror_item(kind, series_slug, season_text, worker_get_driver, use_cache)
+            except Exception as e: print(f"  Error expandiendo {series_slug} {season_text}: {e}"); ok = False
+            mirror_set_status(kind, series_slug, season_text, "", "done" if ok else "failed", None if ok else "sin contenido")
+            return kind
+        # Se reserva espacio para cada episodio antes de encolarlo; lo que no cabe vuelve a la cola
+        episode_bytes = mirror_estimated_episode_size()
+        with disk_lock:
+            fit = mirror_episodes_that_fit(len(batch), disk["used"], disk["reserved"], episode_bytes, quota_bytes, min_free_bytes)
+            for ep_title in batch[:fit]: disk["per_episode"][episode_output_path(series_slug, season_text, ep_title)] = episode_bytes
+            disk["reserved"] += fit * episode_bytes
+        for ep_title in batch[fit:]: mirror_set_status("episode", series_slug, season_text, ep_title, "pending")
+        if not fit: return "full"
+        batch = batch[:fit]
+        season = getattr(opened, "season", None)
+        if season is None or (season.series_slug, season.season_text) != (series_slug, season_text):
+            season = opened.season = SeasonEpisodes(worker_get_driver, series_slug, season_text, use_cache=use_cache)
+        queued_paths, interrupted = set(), True
+        try: download_episodes(season, batch, download_queue, queued_paths); interrupted = False
+        finally:
+            for ep_title in batch:
+                out_path = episode_output_path(series_slug, season_text, ep_title)
+                if out_path in queued_paths: continue
+                with disk_lock: disk["reserved"] -= disk["per_episode"].pop(out_path, 0)
+                # Una parada (o un error del productor) no es culpa del episodio: vuelve a la cola sin gastar intento
+                if interrupted or DOWNLOAD_SHUTDOWN.is_set(): mirror_set_status("episode", series_slug, season_text, ep_title, "pending")
+                else: mirror_fail("episode", series_slug, season_text, ep_title, "sin MPD")
+        return kind
+
+    def produce(download_queue):
+        if num_browsers <= 1:
+            while not DOWNLOAD_SHUTDOWN.is_set() and process_next(get_driver, download_queue) not in (None, "full"): pass
+            return
+        # Cada tarea del pool procesa una fila y se vuelve a encolar; una expansión puede añadir trabajo para
+        # todos los navegadores, así que entonces se completan hasta `num_browsers` cadenas activas.
+        chains = {"active": num_browsers, "stop": False}
+        chains_lock = threading.Lock()
+        def handle_task(_task, worker_get_driver, submit):
+            result = None
+            try: result = None if chains["stop"] or DOWNLOAD_SHUTDOWN.is_set() else process_next(worker_get_driver, download_queue)
+            except (DownloadInterrupted, WebDriverException): raise # El pool recicla el navegador y reintenta la tarea
+            except Exception as e: print(f"  Error en el modo espejo: {e}"); result = "error"
+            with chains_lock:
+                if result == "full": chains["stop"] = True
+                if result in (None, "full") or chains["stop"]: chains["active"] -= 1; return
+                extra = num_browsers - chains["active"] if result in ("series", "season") else 0
+                chains["active"] += extra
+            for _ in range(1 + extra): submit(None)
+        print(f"Usando {num_browsers} navegadores en paralelo.")
+        BrowserPool(num_browsers).run([None] * num_browsers, handle_task)
+
+    try: results = run_pipeline(produce, on_result=on_result)
+    finally: print_mirror_progress()
+    return all(results.values())
 
 # --- Interfaz de Usuario y Lógica Principal ---
 def prompt_for_series(available_series_map):
@@ -334,47 +2457,111 @@ def prompt_for_series(available_series_map):
         if choice == 'b': continue
     return None # No debería llegar
 
-def prompt_for_download_mode_and_episode(driver, selected_season_text, current_episode_elements):
+def prompt_for_season_from_list(season_texts):
+    print("\n--- Selección de Temporada (desde el catálogo) ---")
+    for i, s_text in enumerate(season_texts): print(f"    {i+1}. {s_text}")
+    while True:
+        choice = input(f"  Elige temporada (1-{len(season_texts)}), o 'q' para salir: ")
+        if choice.lower() == 'q': return None
+        try:
+            num = int(choice)
+            if 1 <= num <= len(season_texts): return season_texts[num-1]
+            else: print("  Número fuera de rango.")
+        except ValueError: print("  Entrada inválida.")
+
+def prompt_for_download_mode_and_episode(selected_season_text, episode_titles):
     print("\n--- Modo de Descarga ---")
     while True:
-        mode = input(f"Elige: (1) Episodio único, (2) Temporada completa ('{selected_season_text}'), 'q' salir: ")
+        mode = input(f"Elige: (1) Episodio único, (2) Temporada completa ('{selected_season_text}'), (3) Sincronizar (solo lo nuevo), 'q' salir: ")
         if mode == '1': dl_mode = "single"; break
         elif mode == '2': return "season", None
+        elif mode == '3': return "sync", None
         elif mode.lower() == 'q': return None, None
         else: print("Opción inválida.")
 
     if dl_mode == "single":
         print(f"\n--- Selección de Episodio (para {selected_season_text}) ---")
-        if not current_episode_elements: print("No hay episodios listados."); return None, None
-        
-        ep_titles = []
-        for i, card_el in enumerate(current_episode_elements):
-            title = "Desconocido"
-            try:
-                img = WebDriverWait(card_el, 2).until(EC.presence_of_element_located((By.XPATH, ".//img[@aria-label]")))
-                title = img.get_attribute("aria-label").strip()
-            except:
-                try: h2 = WebDriverWait(card_el, 1).until(EC.presence_of_element_located((By.XPATH, ".//h2"))); title = h2.text.strip()
-                except: title = f"Episodio sin título {i+1}"
-            ep_titles.append(title); print(f"  {i+1}. {title}")
+        if not episode_titles: print("No hay episodios listados."); return None, None
+        for i, title in enumerate(episode_titles): print(f"  {i+1}. {title}")
         
         while True:
-            ep_choice = input(f"Elige episodio (1-{len(ep_titles)}), o título/número exacto, 'q' salir: ")
+            ep_choice = input(f"Elige episodio (1-{len(episode_titles)}), o título/número exacto, 'q' salir: ")
             if ep_choice.lower() == 'q': return None, None
             try:
                 idx = int(ep_choice) - 1
-                if 0 <= idx < len(ep_titles): return dl_mode, ep_titles[idx] # Devuelve el título exacto
+                if 0 <= idx < len(episode_titles): return dl_mode, episode_titles[idx] # Devuelve el título exacto
                 else: print("Número fuera de rango.")
             except ValueError: return dl_mode, ep_choice # Asumir que es el título/número directo
     return None, None
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Descarga episodios de series de DMAX.")
+    parser.add_argument("--refresh", action="store_true", help="Revalida solo las entradas caducadas del catálogo y termina.")
+    parser.add_argument("--sin-cache", action="store_true", help="Ignora el catálogo en disco (aunque lo sigue actualizando).")
+    parser.add_argument("--jobs", metavar="FICHERO", help="Procesa sin preguntas un fichero de trabajos (JSON o YAML).")
+    parser.add_argument("--navegadores", type=int, default=BROWSER_POOL_SIZE, metavar="K",
+                        help="Navegadores headless en paralelo para los modos por lotes y espejo.")
+    parser.add_argument("--base-url", help=f"URL base del sitio (por defecto {DMAX_BASE_URL}); útil con un servidor local.")
+    parser.add_argument("--metricas", metavar="FICHERO", help=f"Fichero JSON Lines de spans (por defecto {METRICS_JSONL_PATH}; '' para desactivar).")
+    parser.add_argument("--prometheus", metavar="FICHERO", help="Escribe también las métricas en formato de texto Prometheus.")
+    parser.add_argument("--backend", choices=["nativo", "yt-dlp"], default=DOWNLOAD_BACKEND,
+                        help="Motor de descarga: DASH nativo (con yt-dlp de respaldo) o solo yt-dlp.")
+    parser.add_argument("--perfil", choices=["captura", "completo"], default=BROWSER_PROFILE,
+                        help="Perfil del navegador: headless y ligero para capturar MPDs, o Chrome completo y visible.")
+    parser.add_argument("--verificar", action="store_true", help="Comprueba la duración de todo lo descargado y aparta lo truncado.")
+    parser.add_argument("--espejo", action="store_true", help="Modo espejo: descarga todo el catálogo con una cola persistente.")
+    parser.add_argument("--prioridad", action="append", default=[], metavar="REGLA",
+                        help="Orden del modo espejo: 'recientes' (temporadas/episodios más nuevos), 'pequenas' (temporadas "
+                             "con menos episodios) o 'serie:<slug>'. Se puede repetir; se aplican en orden.")
+    parser.add_argument("--cuota-gb", type=float, help="Modo espejo: tamaño máximo de la carpeta de descargas.")
+    parser.add_argument("--min-libre-gb", type=float, default=MIRROR_MIN_FREE_BYTES / 1024 ** 3,
+                        help="Modo espejo: espacio libre mínimo que se deja en el disco.")
+    parser.add_argument("--presupuesto", action="append", default=[], metavar="FASE=SEG",
+                        help="Cambia el presupuesto de latencia de una fase (se puede repetir).")
+    return parser.parse_args()
+
+def use_base_url(base_url):
+    # Otro sitio (p.ej. el de bench.py --servir) no comparte catálogo, estado por serie ni índice de contenido con DMAX:
+    # todo va a OUTPUT_BASE_DIR/.sitios/<host>/.
+    global DMAX_BASE_URL, OUTPUT_BASE_DIR, CATALOG_DB_PATH
+    base_url = base_url.rstrip('/')
+    if base_url == DMAX_BASE_URL: return
+    DMAX_BASE_URL = base_url
+    OUTPUT_BASE_DIR = os.path.join(OUTPUT_BASE_DIR, ".sitios", sanitize_filename(urlparse(base_url).netloc or base_url))
+    CATALOG_DB_PATH = os.path.join(OUTPUT_BASE_DIR, ".catalogo.sqlite3")
+    print(f"Sitio {DMAX_BASE_URL}: catálogo y descargas en '{OUTPUT_BASE_DIR}'.")
 
 def main():
+    global METRICS_JSONL_PATH, METRICS_PROMETHEUS_PATH, DOWNLOAD_BACKEND, BROWSER_PROFILE
+    args = parse_args()
+    DOWNLOAD_BACKEND = args.backend
+    BROWSER_PROFILE = args.perfil
+    if args.metricas is not None: METRICS_JSONL_PATH = args.metricas
+    if args.prometheus: METRICS_PROMETHEUS_PATH = args.prometheus
+    if args.base_url: use_base_url(args.base_url)
+    for budget in args.presupuesto:
+        phase, _, seconds = budget.partition("=")
+        try: LATENCY_BUDGETS[phase.strip()] = float(seconds)
+        except ValueError: print(f"Presupuesto inválido '{budget}' (formato FASE=SEG). Se ignora.")
+    use_cache = not args.sin_cache
     driver = None
+    def get_driver(): # El navegador solo se abre si el catálogo no basta
+        nonlocal driver
+        if driver is None: driver = setup_driver_local()
+        return driver
     try:
-        driver = setup_driver_local()
+        if args.refresh: refresh_expired_catalog(get_driver); return
+        if args.verificar: verify_content_index(); return
+        catalog_evict()
+        if args.jobs: run_batch(args.jobs, get_driver, use_cache, args.navegadores); return # Navegadores reutilizados en todos los trabajos
+        if args.espejo:
+            invalid = [r for r in args.prioridad if r not in ("recientes", "pequenas") and not r.startswith("serie:")]
+            if invalid: print(f"Reglas de prioridad no válidas: {', '.join(invalid)}."); return
+            run_mirror(get_driver, use_cache, args.prioridad, args.cuota_gb * 1024 ** 3 if args.cuota_gb else MIRROR_QUOTA_BYTES,
+                       args.min_libre_gb * 1024 ** 3, args.navegadores)
+            return
 
-        all_series_map = get_all_series(driver)
+        all_series_map = get_all_series_cached(get_driver, use_cache)
         if not all_series_map: print("No se pudieron obtener series. Abortando."); return
         
         series_slug = prompt_for_series(all_series_map)
@@ -382,23 +2569,21 @@ def main():
             
         current_series_url = build_series_url_from_slug(series_slug)
         
-        selected_season_text = select_season_interactive(driver, current_series_url)
+        cached_seasons = catalog_get("seasons", series_slug) if use_cache else None
+        if cached_seasons: selected_season_text = prompt_for_season_from_list(cached_seasons)
+        else: selected_season_text = select_season_interactive(get_driver(), current_series_url)
         if not selected_season_text: print("No se seleccionó temporada. Abortando."); return
 
-        # Obtener elementos de episodio DESPUÉS de seleccionar la temporada
-        current_episode_elements = get_episode_elements_for_current_season(driver)
+        # Episodios DESPUÉS de seleccionar la temporada (del catálogo o del navegador)
+        season = SeasonEpisodes(get_driver, series_slug, selected_season_text, season_open=not cached_seasons, use_cache=use_cache)
+        episode_titles = season.titles()
 
-        download_mode, target_episode_input = prompt_for_download_mode_and_episode(driver, selected_season_text, current_episode_elements)
+        download_mode, target_episode_input = prompt_for_download_mode_and_episode(selected_season_text, episode_titles)
         if not download_mode: print("No se seleccionó modo. Abortando."); return
             
         print(f"\n--- Iniciando Descargas ---")
         print(f"Serie: {series_slug}, Temporada: {selected_season_text}, Modo: {download_mode}")
 
-        series_folder = sanitize_filename(series_slug)
-        season_folder_match = re.match(r"(Temporada\s*\d+)", selected_season_text)
-        season_folder = sanitize_filename(season_folder_match.group(1) if season_folder_match else selected_season_text.split('(')[0].strip())
-        season_output_dir = os.path.join(OUTPUT_BASE_DIR, series_folder, season_folder)
-
         if download_mode == "single":
             if not target_episode_input: print("Error: No episodio para modo single."); return
             
@@ -406,52 +2591,36 @@ def main():
             if target_episode_input.isdigit() and EPISODE_NUMBER_PREFIX and not target_episode_input.startswith(EPISODE_NUMBER_PREFIX):
                 ep_title_normalized = f"{EPISODE_NUMBER_PREFIX}{target_episode_input}"
             
-            print(f"  Buscando tarjeta para episodio: '{ep_title_normalized}'")
-            ep_card_xpath = f"//div[contains(@class, 'card--video')][.//img[@aria-label='{ep_title_normalized}']]"
-            try:
-                ep_card = WebDriverWait(driver, SELENIUM_TIMEOUT).until(EC.presence_of_element_located((By.XPATH, ep_card_xpath)))
-                mpd_url = click_episode_and_get_mpd(driver, ep_card, ep_title_normalized)
-                if mpd_url:
-                    out_path = os.path.join(season_output_dir, f"{sanitize_filename(ep_title_normalized)}.mp4")
-                    download_video_with_yt_dlp(mpd_url, out_path, current_series_url)
-                else: print(f"  No MPD para '{ep_title_normalized}'.")
-            except TimeoutException: print(f"  Timeout: No se encontró tarjeta para '{ep_title_normalized}'.")
+            print(f"  Buscando MPD para episodio: '{ep_title_normalized}'")
+            run_pipeline(lambda download_queue: download_episodes(season, [ep_title_normalized], download_queue))
 
         elif download_mode == "season":
-            if not current_episode_elements: print(f"No episodios para '{selected_season_text}'."); return
-            total_eps = len(current_episode_elements)
+            if not episode_titles: print(f"No episodios para '{selected_season_text}'."); return
+            total_eps = len(episode_titles)
             print(f"Descargando {total_eps} episodios de '{selected_season_text}'...")
 
-            for i, ep_card_el in enumerate(current_episode_elements):
-                ep_title = "Desconocido"
-                try:
-                    img = WebDriverWait(ep_card_el, 2).until(EC.presence_of_element_located((By.XPATH, ".//img[@aria-label]")))
-                    ep_title = img.get_attribute("aria-label").strip()
-                except: 
-                    try: h2=WebDriverWait(ep_card_el,1).until(EC.presence_of_element_located((By.XPATH,".//h2")));ep_title=h2.text.strip()
-                    except: ep_title = f"episodio_incognito_{i+1}"
-                
-                print(f"\n--- Procesando {i+1}/{total_eps}: '{ep_title}' ---")
-                mpd_url = None
-                for attempt in range(MAX_RETRIES_MPD + 1):
-                    print(f"  Intento MPD {attempt + 1}/{MAX_RETRIES_MPD + 1}...")
-                    mpd_url = click_episode_and_get_mpd(driver, ep_card_el, ep_title)
-                    if mpd_url: break
-                    if attempt < MAX_RETRIES_MPD: print(f"  Fallo. Reintentando en 5s..."); time.sleep(5)
-                
-                if mpd_url:
-                    out_path = os.path.join(season_output_dir, f"{sanitize_filename(ep_title)}.mp4")
-                    download_video_with_yt_dlp(mpd_url, out_path, current_series_url)
-                else: print(f"  No MPD para '{ep_title}'. Saltando.")
-                time.sleep(3)
+            results = run_pipeline(lambda download_queue: download_episodes(season, episode_titles, download_queue))
+            ok = sum(1 for v in results.values() if v)
+            print(f"Descargas completadas: {ok}/{len(results)} (MPD no encontrados: {total_eps - len(results)}).")
+
+        elif download_mode == "sync":
+            results = run_pipeline(lambda download_queue: sync_season(season, download_queue))
+            ok = sum(1 for v in results.values() if v)
+            print(f"Sincronización completada: {ok}/{len(results)} episodios nuevos descargados.")
     
-    except KeyboardInterrupt: print("\nProceso interrumpido por el usuario.")
+    except KeyboardInterrupt: print("\nProceso interrumpido por el usuario. Las descargas a medias se reanudarán en la próxima ejecución.")
     except Exception as e:
         print(f"Error CRÍTICO en main: {e}")
         import traceback
         traceback.print_exc()
     finally:
         if driver: print("Cerrando navegador..."); driver.quit()
+        report_latency_budget()
+        print_metrics_summary()
+        SCHEDULER.print_summary()
+        if METRICS_PROMETHEUS_PATH:
+            try: write_prometheus_metrics(METRICS_PROMETHEUS_PATH)
+            except OSError as e: print(f"No se pudieron escribir las métricas Prometheus: {e}")
         print("--- Proceso finalizado ---")
 
 if __name__ == "__main__":
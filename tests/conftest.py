@@ -0,0 +1,5 @@
+import os
+import sys
+
+# main.py y bench.py están en la raíz del repositorio, no en un paquete
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
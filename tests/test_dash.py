@@ -0,0 +1,247 @@
+import functools
+import http.server
+import json
+import os
+import shutil
+import threading
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import main
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+MPD_URL = "https://cdn.example/dash/ep1/manifest.mpd?token=abc"
+
+
+def load_mpd(name, mpd_url=MPD_URL):
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return main.parse_mpd(f.read(), mpd_url)
+
+
+def reps_by_id(manifest):
+    return {rep["id"]: rep for rep in manifest["representations"]}
+
+
+def test_parse_mpd_segment_timeline():
+    manifest = load_mpd("timeline.mpd")
+    assert manifest["duration"] == 12.0
+    reps = reps_by_id(manifest)
+    assert sorted(reps) == ["a-en", "a-es", "v1080", "v720"] # Los subtítulos no se descargan
+    base = "https://cdn.example/dash/ep1/contenido/"
+    assert reps["v720"]["init"] == base + "v720/init.mp4"
+    assert reps["v720"]["segments"] == [base + "v720/seg-1-0.m4s", base + "v720/seg-2-4000.m4s", base + "v720/seg-3-8000.m4s"]
+    assert reps["v1080"]["height"] == 1080 and reps["v1080"]["bandwidth"] == 5000000
+
+
+def test_parse_mpd_template_duration_counts_segments():
+    reps = reps_by_id(load_mpd("timeline.mpd"))
+    base = "https://cdn.example/dash/ep1/contenido/"
+    assert reps["a-es"]["content_type"] == "audio" and reps["a-es"]["lang"] == "es"
+    assert reps["a-es"]["segments"] == [base + f"a-es/seg-{n}.m4s" for n in (1, 2, 3)]
+
+
+def test_parse_mpd_representation_template_overrides_adaptation_set():
+    manifest = load_mpd("template_number.mpd", "https://cdn.example/a/b.mpd")
+    assert manifest["duration"] == 10.0
+    (rep,) = manifest["representations"]
+    assert rep["content_type"] == "video" # Sale del mimeType
+    assert rep["init"] == "https://cdn.example/a/init-3000000.mp4"
+    assert rep["segments"] == [f"https://cdn.example/a/v-v-{n:05d}.m4s" for n in range(3)] # ceil(10s / 4s), desde startNumber=0
+
+
+def test_parse_mpd_segment_list_and_single_file():
+    manifest = load_mpd("segment_list.mpd", "https://cdn.example/a/b.mpd")
+    assert manifest["duration"] == 90.5
+    reps = reps_by_id(manifest)
+    assert reps["v"]["init"] == "https://otro-cdn.example/v/init.mp4"
+    assert reps["v"]["segments"] == ["https://otro-cdn.example/v/1.m4s", "https://otro-cdn.example/v/2.m4s"]
+    assert reps["a"]["init"] is None and reps["a"]["segments"] == ["https://cdn.example/a/audio.mp4"]
+
+
+@pytest.mark.parametrize("mpd_text", [
+    "<MPD",
+    '<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="dynamic"><Period/></MPD>',
+    '<MPD xmlns="urn:mpeg:dash:schema:mpd:2011"><Period duration="PT1S"/><Period duration="PT1S"/></MPD>',
+    '<MPD xmlns="urn:mpeg:dash:schema:mpd:2011"><Period duration="PT1S"><AdaptationSet contentType="text"/></Period></MPD>',
+])
+def test_parse_mpd_rejects_unsupported(mpd_text):
+    with pytest.raises(main.DashError):
+        main.parse_mpd(mpd_text, MPD_URL)
+
+
+def adaptation_set(xml):
+    as_el = ET.fromstring(f'<AdaptationSet xmlns="urn:mpeg:dash:schema:mpd:2011">{xml}</AdaptationSet>')
+    return as_el, as_el.find("{*}Representation")
+
+
+def test_build_segment_urls_open_timeline_repeats_to_period_end():
+    as_el, rep_el = adaptation_set('<SegmentTemplate timescale="10" media="s$Number$.m4s"><SegmentTimeline>'
+                                   '<S t="0" d="20" r="-1"/></SegmentTimeline></SegmentTemplate><Representation id="r"/>')
+    init, segments = main.build_segment_urls(as_el, rep_el, "https://cdn.example/", 7.0)
+    assert init is None
+    assert segments == [f"https://cdn.example/s{n}.m4s" for n in range(1, 5)] # ceil(7s / 2s)
+    with pytest.raises(main.DashError):
+        main.build_segment_urls(as_el, rep_el, "https://cdn.example/", None)
+
+
+def test_build_segment_urls_rejects_byte_ranges():
+    as_el, rep_el = adaptation_set('<Representation id="r"><SegmentList><SegmentURL media="a.mp4" mediaRange="0-99"/>'
+                                   '</SegmentList></Representation>')
+    with pytest.raises(main.DashError):
+        main.build_segment_urls(as_el, rep_el, "https://cdn.example/", 10.0)
+
+
+def test_select_representations_prefers_best_video_and_spanish_audio():
+    selected = main.select_representations(load_mpd("timeline.mpd"))
+    assert [rep["id"] for rep in selected] == ["v1080", "a-es"] # a-es gana a a-en aunque tenga menos bitrate
+
+
+def test_select_representations_honours_max_height(monkeypatch):
+    monkeypatch.setattr(main, "DASH_MAX_HEIGHT", 720)
+    assert [rep["id"] for rep in main.select_representations(load_mpd("timeline.mpd"))] == ["v720", "a-es"]
+    monkeypatch.setattr(main, "DASH_MAX_HEIGHT", 480) # Nada cabe: la mejor disponible antes que ninguna
+    assert [rep["id"] for rep in main.select_representations(load_mpd("timeline.mpd"))] == ["v1080", "a-es"]
+
+
+def test_select_representations_without_preferred_language():
+    manifest = load_mpd("timeline.mpd")
+    manifest["representations"] = [r for r in manifest["representations"] if r["id"] != "a-es"]
+    assert [rep["id"] for rep in main.select_representations(manifest)] == ["v1080", "a-en"]
+
+
+# --- Descarga y reanudación (sin red: fetch_bytes sustituido) ---
+def segment_body(url):
+    return f"<{url.rsplit('/', 1)[-1]}>".encode()
+
+
+@pytest.fixture
+def native_env(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "METRICS_JSONL_PATH", "")
+    monkeypatch.setattr(main, "DASH_SEGMENT_WORKERS", 2)
+    monkeypatch.setattr(main.shutil, "which", lambda name: None) # Sin ffmpeg: una sola pista se renombra tal cual
+    yield tmp_path
+    main.DOWNLOAD_SHUTDOWN.clear()
+
+
+def fake_fetch(fail_at=None, fetched=None):
+    with open(os.path.join(FIXTURES_DIR, "single_track.mpd"), "rb") as f: mpd_bytes = f.read()
+    def fetch(url, headers=None):
+        if url.endswith(".mpd"): return mpd_bytes
+        if fetched is not None: fetched.append(url.rsplit("/", 1)[-1])
+        if fail_at and url.endswith(f"/{fail_at}"): main.DOWNLOAD_SHUTDOWN.set() # Como Ctrl-C a mitad de descarga
+        return segment_body(url)
+    return fetch
+
+
+SINGLE_TRACK_NAMES = ["init.mp4"] + [f"seg-{n}.m4s" for n in range(1, 11)]
+SINGLE_TRACK_BYTES = b"".join(f"<{name}>".encode() for name in SINGLE_TRACK_NAMES)
+
+
+def test_download_representation_resume_truncates_unconfirmed_bytes(native_env, monkeypatch):
+    rep = reps_by_id(load_mpd("single_track.mpd"))["v"]
+    part_path = str(native_env / "v.part")
+    confirmed = b"".join(f"<{name}>".encode() for name in SINGLE_TRACK_NAMES[:4])
+    with open(part_path, "wb") as f: f.write(confirmed + b"<seg-4.m4s> a medias") # Escrito tras el último checkpoint
+    fetched = []
+    monkeypatch.setattr(main, "fetch_bytes", fake_fetch(fetched=fetched))
+    state = {"done": 4, "bytes": len(confirmed)}
+    assert main.download_representation(rep, part_path, {}, state) == len(SINGLE_TRACK_BYTES)
+    assert fetched == SINGLE_TRACK_NAMES[4:] # Solo lo que faltaba
+    with open(part_path, "rb") as f: assert f.read() == SINGLE_TRACK_BYTES
+    assert state == {"done": 11, "bytes": len(SINGLE_TRACK_BYTES)}
+
+
+def test_download_representation_restarts_when_part_is_shorter_than_state(native_env, monkeypatch):
+    rep = reps_by_id(load_mpd("single_track.mpd"))["v"]
+    part_path = str(native_env / "v.part")
+    with open(part_path, "wb") as f: f.write(b"<init.mp4>")
+    fetched = []
+    monkeypatch.setattr(main, "fetch_bytes", fake_fetch(fetched=fetched))
+    state = {"done": 4, "bytes": 100} # El .part no tiene lo que dice el diario: no se puede confiar en él
+    main.download_representation(rep, part_path, {}, state)
+    assert fetched == SINGLE_TRACK_NAMES
+    with open(part_path, "rb") as f: assert f.read() == SINGLE_TRACK_BYTES
+
+
+def test_download_dash_native_interrupted_then_resumed(native_env, monkeypatch):
+    output_path = str(native_env / "episodio.mp4")
+    mpd_url = "https://cdn.example/dash/ep1/manifest.mpd"
+    monkeypatch.setattr(main, "fetch_bytes", fake_fetch(fail_at="seg-5.m4s"))
+    with pytest.raises(main.DownloadInterrupted):
+        main.download_dash_native(mpd_url, output_path, None)
+    assert not os.path.exists(output_path)
+    with open(main.journal_path(output_path), encoding="utf-8") as f: journal = json.load(f)
+    assert journal["mpd_url"] == mpd_url
+    (rep_state,) = journal["representations"]
+    assert rep_state["id"] == "v" and rep_state["total"] == 11 and 0 < rep_state["done"] < 11
+    with open(f"{output_path}.video.part", "rb") as f: # El .part contiene justo lo confirmado en el diario
+        assert f.read() == b"".join(f"<{name}>".encode() for name in SINGLE_TRACK_NAMES[:rep_state["done"]])
+    assert rep_state["bytes"] == os.path.getsize(f"{output_path}.video.part")
+
+    main.DOWNLOAD_SHUTDOWN.clear()
+    fetched = []
+    monkeypatch.setattr(main, "fetch_bytes", fake_fetch(fetched=fetched))
+    assert main.download_dash_native(mpd_url, output_path, None) is True
+    assert fetched == SINGLE_TRACK_NAMES[rep_state["done"]:]
+    with open(output_path, "rb") as f: assert f.read() == SINGLE_TRACK_BYTES
+    assert not os.path.exists(main.journal_path(output_path)) and not os.path.exists(f"{output_path}.video.part")
+
+
+def test_download_dash_native_without_ffmpeg_fails_before_fetching_segments(native_env, monkeypatch):
+    with open(os.path.join(FIXTURES_DIR, "timeline.mpd"), "rb") as f: mpd_bytes = f.read()
+    fetched = []
+    def fetch(url, headers=None):
+        fetched.append(url)
+        return mpd_bytes
+    monkeypatch.setattr(main, "fetch_bytes", fetch)
+    with pytest.raises(main.DashError):
+        main.download_dash_native(MPD_URL, str(native_env / "episodio.mp4"), None) # Vídeo y audio: hace falta ffmpeg
+    assert fetched == [MPD_URL]
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("PT45M12.5S", 2712.5),
+    ("P0Y0M0DT0H45M12.000S", 2712.0),
+    ("P1DT1H", 90000.0),
+    ("PT0S", 0.0),
+    ("", None),
+    ("45:12", None),
+])
+def test_parse_iso_duration(value, seconds):
+    assert main.parse_iso_duration(value) == seconds
+
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args): pass
+
+
+@pytest.fixture
+def dash_server(tmp_path):
+    # Sirve single_track.mpd y sus segmentos por HTTP real desde un directorio temporal.
+    site_dir = tmp_path / "sitio"
+    site_dir.mkdir()
+    shutil.copy(os.path.join(FIXTURES_DIR, "single_track.mpd"), site_dir / "manifest.mpd")
+    for name in SINGLE_TRACK_NAMES: (site_dir / name).write_bytes(f"<{name}>".encode())
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=str(site_dir)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/manifest.mpd"
+    server.shutdown(); server.server_close()
+
+
+def test_download_dash_native_from_local_server(native_env, dash_server):
+    output_path = str(native_env / "serie" / "episodio.mp4")
+    assert main.download_dash_native(dash_server, output_path, "http://127.0.0.1/series/serie") is True
+    with open(output_path, "rb") as f: assert f.read() == SINGLE_TRACK_BYTES
+    assert not os.path.exists(main.journal_path(output_path))
+
+
+def test_verify_uses_duration_read_before_download(native_env, dash_server, monkeypatch):
+    output_path = str(native_env / "episodio.mp4")
+    main.download_dash_native(dash_server, output_path, None)
+    monkeypatch.setattr(main, "fetch_bytes", lambda url, headers=None: pytest.fail("el MPD ya no se vuelve a pedir"))
+    assert main.mpd_expected_duration(dash_server) == 10.0
+    main.record_download_result(False, dash_server, output_path, None)
+    assert dash_server not in main._mpd_durations # Se olvida tras registrar el resultado
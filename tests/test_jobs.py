@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+import main
+
+
+def write_jobs(tmp_path, jobs):
+    path = tmp_path / "trabajos.json"
+    path.write_text(json.dumps(jobs), encoding="utf-8")
+    return str(path)
+
+
+def test_load_job_file_normalizes_seasons(tmp_path):
+    jobs = main.load_job_file(write_jobs(tmp_path, [
+        {"series": "a", "seasons": 2},
+        {"series": "b", "seasons": [1, "Temporada 3 (2024)", "4"], "episodes": [1, "Episodio 3"]},
+        {"series": "c", "mode": "sync"},
+    ]))
+    assert [job["seasons"] for job in jobs] == [["Temporada 2"], ["Temporada 1", "Temporada 3 (2024)", "Temporada 4"], "all"]
+    assert jobs[1]["episodes"] == [1, "Episodio 3"] and jobs[2]["episodes"] == "all"
+    assert main.find_season_index(["Temporada 1 (2023)", "Temporada 2 (2024)"], jobs[0]["seasons"][0]) == 1
+
+
+def test_load_job_file_accepts_object_with_jobs(tmp_path):
+    assert main.load_job_file(write_jobs(tmp_path, {"jobs": [{"series": "a"}]}))[0]["series"] == "a"
+
+
+@pytest.mark.parametrize("job", [
+    {"seasons": "all"},
+    {"series": "a", "seasons": {"1": True}},
+    {"series": "a", "seasons": []},
+    {"series": "a", "seasons": [1.5]},
+    {"series": "a", "episodes": None},
+    {"series": "a", "episodes": [True]},
+    {"series": "a", "mode": "espejo"},
+    "a",
+])
+def test_load_job_file_rejects_invalid_jobs(tmp_path, job):
+    with pytest.raises(ValueError):
+        main.load_job_file(write_jobs(tmp_path, [job]))
@@ -0,0 +1,24 @@
+import pytest
+
+import main
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "CATALOG_DB_PATH", str(tmp_path / "catalogo.sqlite3"))
+    monkeypatch.setattr(main, "_catalog_conn", None)
+    yield
+    main._catalog_conn.close()
+
+
+def test_season_recency_prefers_year_over_season_number():
+    seasons = ["Temporada 14", "Temporada 1 (2025)", "Temporada 3 (2019)", "Temporada 2"]
+    assert sorted(seasons, key=main.season_recency, reverse=True) == [
+        "Temporada 1 (2025)", "Temporada 3 (2019)", "Temporada 14", "Temporada 2"]
+
+
+def test_recientes_orders_queue_by_year(catalog):
+    main.mirror_add("episode", "antigua", "Temporada 14", ["a1", "a2"], main.season_number("Temporada 14"))
+    main.mirror_add("episode", "nueva", "Temporada 1 (2025)", ["n1", "n2"], main.season_number("Temporada 1 (2025)"))
+    (kind, series, season), batch = main.mirror_next_batch(["recientes"])
+    assert (series, season, batch) == ("nueva", "Temporada 1 (2025)", ["n2", "n1"])
@@ -0,0 +1,70 @@
+import os
+import types
+
+import main
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def load_html(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def fake_driver(name):
+    return types.SimpleNamespace(page_source=load_html(name))
+
+
+def fake_elements(*texts):
+    return [types.SimpleNamespace(text=text) for text in texts]
+
+
+def test_season_options_skip_container_with_similar_class():
+    page = main.parse_dmax_page(load_html("series_multi.html"))
+    assert page["season_trigger"] == "Temporada 2 (2024)"
+    # El contenedor 'select__options' no es una opción; 'select__option--active' sí lo es porque lleva también 'select__option'
+    assert page["season_options"] == ["Temporada 1 (2023)", "Temporada 2 (2024)", ""]
+    assert page["single_season_title"] is None
+
+
+def test_episode_cards_in_document_order():
+    cards = main.parse_dmax_page(load_html("series_multi.html"))["episode_cards"]
+    # Ni el contenedor 'card--video-list' ni la promoción sin img[@aria-label] son tarjetas
+    assert [card["position"] for card in cards] == [0, 1, 2]
+    assert [card["title"] for card in cards] == ["Episodio 1", 'Episodio 2: "Rescate"', "Episodio sin título 3"]
+    assert [card["href"] for card in cards] == ["/series/serie-de-prueba/temporada-2/episodio-1",
+                                                 "/series/serie-de-prueba/temporada-2/episodio-2", None]
+
+
+def test_json_ld_skips_invalid_blocks():
+    assert main.parse_dmax_page(load_html("series_multi.html"))["json_ld"] == [
+        {"@context": "https://schema.org", "@type": "TVSeries", "name": "Serie de prueba"}]
+
+
+def test_single_season_title():
+    page = main.parse_dmax_page(load_html("series_single.html"))
+    assert page["single_season_title"] == "Temporada 1 (2022)"
+    assert page["season_trigger"] is None and page["season_options"] == []
+    assert [card["title"] for card in page["episode_cards"]] == ["Episodio 1"]
+
+
+def test_extract_series_from_page():
+    series = main.extract_series_from_page(main.parse_dmax_page(load_html("series_index.html")))
+    assert series == {"Alaska: Los Últimos": "alaska-los-ultimos", "Aventura en pelotas": "aventura-en-pelotas"}
+
+
+def test_read_season_options_aligns_texts_with_elements():
+    elements = fake_elements("", "", "") # Con el desplegable cerrado Selenium no da texto; el page_source sí
+    options = main.read_season_options(fake_driver("series_multi.html"), elements)
+    assert options == [(elements[0], "Temporada 1 (2023)"), (elements[1], "Temporada 2 (2024)")]
+
+
+def test_read_season_options_falls_back_to_element_text_on_mismatch():
+    elements = fake_elements("Temporada 1", "Temporada 2")
+    options = main.read_season_options(fake_driver("series_multi.html"), elements)
+    assert options == [(elements[0], "Temporada 1"), (elements[1], "Temporada 2")]
+
+
+def test_episode_titles_from_page_source():
+    assert main.get_episode_titles(fake_elements("", "", ""), fake_driver("series_multi.html")) == [
+        "Episodio 1", 'Episodio 2: "Rescate"', "Episodio sin título 3"]
@@ -0,0 +1,53 @@
+import http.server
+import threading
+
+import pytest
+import requests
+
+import main
+
+
+def throttled_error(retry_after):
+    response = requests.Response()
+    response.status_code = 429
+    response.headers["Retry-After"] = retry_after
+    return requests.HTTPError("429 Too Many Requests", response=response)
+
+
+def test_retry_after_is_capped_by_retry_max_delay():
+    scheduler = main.HostScheduler()
+    assert scheduler._retry_delay("cdn", throttled_error("3600"), 0, 3, "") == main.RETRY_MAX_DELAY
+    assert scheduler._retry_delay("cdn", throttled_error("2"), 0, 3, "") == 2.0
+
+
+class FlakyHandler(http.server.BaseHTTPRequestHandler):
+    # /manifest.mpd responde 429 a la primera petición; /perdido.mpd siempre 404.
+    requests_seen = []
+
+    def do_GET(self):
+        self.requests_seen.append(self.path)
+        status = 404 if self.path == "/perdido.mpd" else 429 if self.requests_seen.count(self.path) == 1 else 200
+        self.send_response(status)
+        if status == 429: self.send_header("Retry-After", "0.01")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def flaky_server(monkeypatch):
+    monkeypatch.setattr(main, "SCHEDULER", main.HostScheduler())
+    FlakyHandler.requests_seen = []
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown(); server.server_close()
+
+
+def test_is_mpd_reachable_goes_through_scheduler(flaky_server):
+    assert main.is_mpd_reachable(f"{flaky_server}/manifest.mpd") is True # El 429 se reintenta
+    assert main.is_mpd_reachable(f"{flaky_server}/perdido.mpd") is False # El 404 no
+    assert FlakyHandler.requests_seen == ["/manifest.mpd", "/manifest.mpd", "/perdido.mpd"]
+    assert main.SCHEDULER._hosts[main.host_of(flaky_server)]["throttled"] == 1